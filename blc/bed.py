@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+import gzip
+from collections import defaultdict
+
+
+def read_bed_regions(bed_file, lengths):
+    """
+    {contig: [(start, end), ...]} (0-based, half open) - intervals are grouped by contig (in the
+    order of lengths), sorted, merged and clipped to the contig length. Overlapping intervals thus
+    count once and contigs that are not in lengths are ignored, just like samtools depth -b does.
+    Without lengths (None) all contigs are kept, in the order of the BED file, and not clipped.
+
+    Plain and gzip / bgzip compressed BED files are supported.
+    """
+    intervals = defaultdict(list)
+
+    for columns in read_bed_columns(bed_file):
+        contig, start, end = columns[0:3]
+        if lengths is None:
+            intervals[contig].append((max(int(start), 0), int(end)))
+        elif contig in lengths:
+            intervals[contig].append((max(int(start), 0), min(int(end), lengths[contig])))
+
+    spans = {}
+    for contig in (lengths if lengths is not None else intervals):
+        if contig in intervals:
+            merged = merge_intervals(intervals[contig])
+            if merged:
+                spans[contig] = merged
+
+    return spans
+
+
+def read_named_bed_regions(bed_file, lengths):
+    """
+    {name: {contig: [(start, end), ...]}} - the regions of every name (4th column, or
+    contig:start-end if there is none) in order of first occurrence, treated as by
+    read_bed_regions: per name, overlapping intervals count once. Intervals of different names may
+    overlap. Names without any position on the contigs of lengths are dropped.
+    """
+    intervals = {}
+
+    for columns in read_bed_columns(bed_file):
+        contig, start, end = columns[0:3]
+        name = columns[3] if len(columns) > 3 else f"{contig}:{int(start) + 1}-{end}"
+        if contig in lengths:
+            intervals.setdefault(name, defaultdict(list))[contig].append((max(int(start), 0), min(int(end), lengths[contig])))
+
+    regions = {}
+    for name, name_intervals in intervals.items():
+        spans = {}
+        for contig in lengths:
+            if contig in name_intervals:
+                merged = merge_intervals(name_intervals[contig])
+                if merged:
+                    spans[contig] = merged
+
+        if spans:
+            regions[name] = spans
+
+    return regions
+
+
+def read_bed_columns(bed_file):
+    """
+    Yields the (tab separated) columns of every interval line of a plain or gzip / bgzip compressed
+    BED file
+    """
+    with open(bed_file, 'rb') as fh:
+        compressed = fh.read(2) == b'\x1f\x8b'
+
+    with (gzip.open(bed_file, 'rt') if compressed else open(bed_file, 'r')) as fh:
+        for line in fh:
+            if line.strip() and not line.startswith(('#', 'track', 'browser')):
+                yield line.rstrip('\r\n').split('\t') if '\t' in line else line.split()
+
+
+def merge_intervals(intervals):
+    """
+    sorted list of disjoint intervals; overlapping and adjacent intervals are merged, empty ones dropped
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if start >= end:
+            continue
+
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def write_bed_regions(spans, fh):
+    for contig, contig_spans in spans.items():
+        for start, end in contig_spans:
+            fh.write(f"{contig}\t{start}\t{end}\n")
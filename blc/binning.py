@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+import math
+import numpy as np
+
+
+class LogBinning:
+    """
+    HDR-style binning of depths, to bound the size of depth histograms of ultra deep (e.g. amplicon
+    or UMI) data: depths up to exact_depth are counted exactly, deeper positions are counted in
+    log-spaced bins. Every depth d of a bin is represented by one (integer) depth r of that bin with
+
+        |r - d| <= relative_error * d
+
+    Bins are identified by their index, which is the depth itself for the exact depths, so that
+    dense arrays of frequencies per bin add up like dense arrays of frequencies per depth: across
+    windows, shards and workers, as long as all of them use the same exact_depth and
+    relative_error. A histogram has at most
+
+        exact_depth + 1 + log(2 ** 63 / exact_depth) / log((1 + relative_error) / (1 - relative_error))
+
+    bins, whatever the depth, e.g. 1000 + 1 + 1835 for the defaults.
+
+    The positions of a bin keep their order relative to all other positions, only their depths are
+    off by at most relative_error. As the ROC is the average of a weight in [0, 1] per sequenced
+    base, with the bases ordered by depth, it is off by at most
+
+        relative_error / (1 - relative_error) * fraction of the sequenced bases in log-spaced bins
+
+    (see roc_error_bound). The coverage curve is exact at the lowest depth of every bin, but that
+    point is reported at the representative depth of the bin.
+    """
+    DEFAULT_EXACT_DEPTH = 1000
+    DEFAULT_RELATIVE_ERROR = 0.01
+
+    def __init__(self, exact_depth=DEFAULT_EXACT_DEPTH, relative_error=DEFAULT_RELATIVE_ERROR):
+        if exact_depth < 0:
+            raise ValueError(f"Exact depth must be at least 0: {exact_depth}")
+
+        if not 0 < relative_error < 1:
+            raise ValueError(f"Relative error must be between 0 and 1: {relative_error}")
+
+        self.exact_depth = exact_depth
+        self.relative_error = relative_error
+
+        # lowest and representative depth of the log-spaced bins, extended on demand
+        self.lower_depths = np.array([exact_depth + 1], dtype=np.int64)
+        self.representative_depths = np.array([self._representative_depth(exact_depth + 1)], dtype=np.int64)
+
+    def settings(self):
+        return [self.exact_depth, self.relative_error]
+
+    def max_bins(self):
+        return self.exact_depth + 1 + math.ceil(math.log(2 ** 63 / (self.exact_depth + 1)) / math.log((1 + self.relative_error) / (1 - self.relative_error)))
+
+    def index(self, depths):
+        """
+        bin index per depth (array)
+        """
+        depths = np.asarray(depths, dtype=np.int64)
+        if not len(depths) or depths.max() <= self.exact_depth:
+            return depths
+
+        self._extend(int(depths.max()))
+        binned = depths > self.exact_depth
+
+        indices = depths.copy()
+        indices[binned] = self.exact_depth + np.searchsorted(self.lower_depths, depths[binned], side='right')
+
+        return indices
+
+    def depths(self, n):
+        """
+        representative depth of the first n bins
+        """
+        binned = max(0, n - self.exact_depth - 1)
+        self._extend(0, binned)
+
+        return np.concatenate((np.arange(min(n, self.exact_depth + 1), dtype=np.int64), self.representative_depths[:binned]))
+
+    def roc_error_bound(self, idx_observed):
+        """
+        Upper bound of the absolute error of the ROC of a binned histogram {representative depth:
+        frequency}, relative to the ROC of the exact histogram. Representative depths above
+        exact_depth belong to log-spaced bins.
+        """
+        e = self.relative_error
+
+        total_sequenced_bases = sum(depth * frequency for depth, frequency in idx_observed.items())
+        binned_sequenced_bases = sum(depth * frequency for depth, frequency in idx_observed.items() if depth > self.exact_depth)
+        if not binned_sequenced_bases:
+            return 0.0
+
+        # the fraction of binned bases itself is estimated from the representative depths
+        binned_fraction = min(1.0, 1.0 * binned_sequenced_bases / total_sequenced_bases * (1 + e) / (1 - e))
+
+        return e / (1 - e) * binned_fraction
+
+    def _representative_depth(self, lower_depth):
+        return max(lower_depth, math.floor(lower_depth * (1 + self.relative_error)))
+
+    def _extend(self, depth, n=0):
+        """
+        adds bins until depth is covered and there are at least n log-spaced bins
+        """
+        lower_depths = self.lower_depths.tolist()
+        representative_depths = self.representative_depths.tolist()
+
+        while self._upper_depth(representative_depths[-1]) <= depth or len(lower_depths) < n:
+            lower_depths.append(self._upper_depth(representative_depths[-1]))
+            representative_depths.append(self._representative_depth(lower_depths[-1]))
+
+        self.lower_depths = np.array(lower_depths, dtype=np.int64)
+        self.representative_depths = np.array(representative_depths, dtype=np.int64)
+
+    def _upper_depth(self, representative_depth):
+        """
+        lowest depth of the next bin: all depths d of the bin satisfy d * (1 - relative_error) <= r
+        """
+        return math.floor(int(representative_depth) / (1 - self.relative_error)) + 1
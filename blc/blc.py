@@ -5,15 +5,28 @@
 """[License: GNU General Public License v3 (GPLv3)]
 """
 
-import pysam
+import numpy as np
+import hashlib
+import json
+import random
+import stat
 import subprocess
 import functools
 import warnings
-from collections import defaultdict
-import matplotlib.pyplot as plt
+from collections import deque
+from contextlib import contextmanager, nullcontext
 import tempfile
+import shutil
 import os
+from bisect import bisect_left, bisect_right
 from multiprocessing import Process
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from blc.bed import read_bed_regions, read_named_bed_regions, merge_intervals, write_bed_regions
+from blc.progress import Progress
+from blc.histogram import DepthHistogram
+from blc.coverage import read_runs, contig_lengths
+from blc.lines import read_line_chunks, parse_integers
 
 
 def deprecated(func):
@@ -24,70 +37,1278 @@ def deprecated(func):
     return wrapper
 
 
+def measured(func):
+    """
+    Records the method as a stage (named after it) in self.metrics, if set
+    """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._stage(func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def figure():
+    """
+    New figure that is not registered with pyplot, so that figures can be drawn concurrently in
+    threads or processes. matplotlib is only imported once a figure is drawn, and as the figure is
+    written straight to file no (interactive) backend or display is needed.
+    """
+    from matplotlib.figure import Figure
+    return Figure()
+
+
 class BamLorenzCoverage:
     READ_BUFFER_SIZE = 256 * 1024
-
-    def __init__(self):
-        pass
+    WINDOW_SIZE = 1024 * 1024
+    SHARD_SIZE = 16 * 1024 * 1024
+    FETCH_GAP = 16 * 1024
+    SAMPLE_WINDOW_SIZE = 16 * 1024
+    SAMPLE_TASK_SIZE = 64
+    BOOTSTRAP_ITERATIONS = 200
+
+    ENGINES = ('samtools', 'native')
+
+    # samtools depth its default filter: UNMAP, SECONDARY, QCFAIL, DUP
+    DEFAULT_EXCLUDE_FLAGS = 0x4 | 0x100 | 0x200 | 0x400
+
+    # M, =, X consume query and reference; I, S only the query; D, N only the reference
+    CIGAR_ALIGNED = (0, 7, 8)
+    CIGAR_QUERY = (1, 4)
+    CIGAR_REFERENCE = (2, 3)
+
+    def __init__(self, engine='samtools', threads=1, skip_zero_depth=False, cache=None, shard=None, reference=None, decompression_threads=1, reference_cache=None,
+                 min_mapq=0, min_baseq=0, exclude_flags=DEFAULT_EXCLUDE_FLAGS, include_flags=0, metrics=None, progress=False, binning=None):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine: {engine} (choose from: {', '.join(self.ENGINES)})")
+
+        if threads < 1:
+            raise ValueError(f"Number of threads must be at least 1: {threads}")
+
+        if shard is not None and not 1 <= shard[0] <= shard[1]:
+            raise ValueError(f"Invalid shard: {shard[0]}/{shard[1]}")
+
+        if decompression_threads < 1:
+            raise ValueError(f"Number of decompression threads must be at least 1: {decompression_threads}")
+
+        self.engine = engine
+        self.threads = threads
+        self.skip_zero_depth = skip_zero_depth
+        self.cache = cache
+        self.shard = tuple(shard) if shard else None
+        self.reference = reference
+        self.decompression_threads = decompression_threads
+        self.reference_cache = reference_cache
+
+        # read filters, as in samtools depth -Q, -q, -g/-G and --incl-flags
+        self.min_mapq = min_mapq
+        self.min_baseq = min_baseq
+        self.exclude_flags = exclude_flags
+        self.include_flags = include_flags
+
+        # blc.metrics.Metrics: timings of the stages of bam_file_to_idx and of the estimators and exporters
+        self.metrics = metrics
+        self.progress = progress
+
+        # blc.binning.LogBinning: depths above its exact depth are counted in log-spaced bins
+        self.binning = binning
+
+        # CRAM files whose sequences are all in the reference cache: {alignment file: bool}
+        self._decoded_from_cache = {}
 
     def bam_file_to_idx(self, bam_file, region=None, bed_regions=None):
         """
         Coverage plot needs the zero-statistic - i.e. the number of genomic bases not covered by reads
+
+        engine 'samtools' parses the text output of `samtools depth -a`, engine 'native' builds the
+        histogram directly from the alignment blocks - both return identical results
+
+        with threads > 1 the genome is split into shards that are processed by a pool of workers
+
+        with skip_zero_depth samtools depth only streams covered positions (no -a) and the number of
+        uncovered positions is derived from the size of the investigated contigs / regions instead
+
+        with a cache (blc.cache.HistogramCache) results of earlier runs are reused
+
+        with shard=(i, N) only the i-th of N equally sized, disjoint parts of the investigated
+        positions is scanned; the histograms of all N shards sum up to the complete histogram
+
+        CRAM files are decoded with the reference (FASTA) and decompression_threads htslib threads
+        per file handle, in all engines and workers - with a reference_cache
+        (blc.reference.ReferenceCache), CRAM files with M5 tags are decoded from its memory mapped
+        sequences instead
+
+        reads are filtered on min_mapq, exclude_flags (any) and include_flags (any, if set), and bases
+        on min_baseq, in all engines and workers
+
+        a stream ('-' for stdin, or a named pipe) of coordinate sorted SAM/BAM is read in a single
+        pass while it is being written, regardless of engine and threads
+
+        with metrics (blc.metrics.Metrics) the run and its stages are timed
+
+        with progress the percentage done, positions per second and ETA are written to stderr
+
+        with binning (blc.binning.LogBinning) deep positions are counted in log-spaced bins and
+        idx_observed has the representative depths of the bins: its size is bounded, whatever the
+        depth, in all engines and workers
+        """
+        if region:
+            bed_regions = None
+
+        with self._stage('bam_file_to_idx', bam_file=bam_file, engine=self.engine, threads=self.threads) as record:
+            idx = self._cache_get(bam_file, region, bed_regions)
+            record['cached'] = idx is not None
+
+            if idx is None:
+                if self.is_stream(bam_file):
+                    idx = self._stream_to_idx(bam_file, region, bed_regions)
+                elif self.threads > 1 or self.shard:
+                    with (ProcessPoolExecutor(self.threads) if self.threads > 1 else ThreadPoolExecutor(1)) as pool:
+                        idx = self._merge_shards(bam_file, self._submit_shards(pool, bam_file, region, bed_regions), region)
+                elif self.engine == 'native':
+                    idx = self._native_bam_file_to_idx(bam_file, region, bed_regions)
+                else:
+                    idx = self._samtools_bam_file_to_idx(bam_file, region, bed_regions)
+
+                self._cache_put(bam_file, region, bed_regions, idx)
+
+            record['positions'] = idx[1]
+
+        return idx
+
+    def bam_files_to_idx(self, bam_files, region=None, bed_regions=None, pool=None):
+        """
+        Yields (idx_observed, total_investigated_genomic_positions) per alignment file, in order.
+
+        with threads > 1 the shards of all files share one pool of workers - the given pool, if the
+        caller shares its own; the shards of the next files are already scheduled while the results
+        of the current file are being processed
+        """
+        if region:
+            bed_regions = None
+
+        if self.threads > 1:
+            with self._pool(pool) as pool:
+                pending = deque()
+                for bam_file in bam_files:
+                    idx = self._cache_get(bam_file, region, bed_regions)
+                    if idx is None and self.is_stream(bam_file):
+                        idx = self._stream_to_idx(bam_file, region, bed_regions)
+                    pending.append((bam_file, idx, None if idx is not None else self._submit_shards(pool, bam_file, region, bed_regions)))
+
+                    # bounded look-ahead, to keep the number of unmerged shard results limited
+                    if len(pending) > self.threads:
+                        yield self._finish_pending(*pending.popleft(), region, bed_regions)
+
+                while pending:
+                    yield self._finish_pending(*pending.popleft(), region, bed_regions)
+        else:
+            for bam_file in bam_files:
+                yield self.bam_file_to_idx(bam_file, region, bed_regions)
+
+    def run_length_file_to_idx(self, coverage_file, region=None, bed_regions=None):
+        """
+        (idx_observed, total_investigated_genomic_positions) of a run-length coverage file (bedGraph,
+        mosdepth per-base.bed.gz or bigWig, see blc.coverage) instead of an alignment file: every
+        run counts with its length, restricted to the region or BED regions. The runs of each chunk
+        of the file are counted at once with np.bincount.
+
+        The investigated positions are the positions in the file (within the region): positions
+        that are not in the file, such as the uncovered ones of `bedtools genomecov -bg`, do not
+        count. mosdepth and `bedtools genomecov -bga` include uncovered runs.
+        """
+        if self.shard:
+            raise ValueError(f"Sharding requires an alignment file, not a coverage file: {coverage_file}")
+
+        if region:
+            bed_regions = None
+
+        with self._stage('run_length_file_to_idx', coverage_file=coverage_file) as record:
+            idx = self._cache_get(coverage_file, region, bed_regions)
+            record['cached'] = idx is not None
+
+            if idx is None:
+                spans = self._run_length_spans(coverage_file, region, bed_regions)
+                counts = np.zeros(1, dtype=np.int64)
+
+                for contig, starts, ends, depths in read_runs(coverage_file, record):
+                    if spans is None:
+                        lengths = ends - starts
+                    elif contig in spans:
+                        lengths = self._covered_lengths(spans[contig], ends) - self._covered_lengths(spans[contig], starts)
+                    else:
+                        continue
+
+                    if np.any(lengths < 0):
+                        raise ValueError(f"Invalid run in coverage file, end before start: {coverage_file}")
+
+                    # float weights are exact: the positions of one chunk stay far below 2 ** 53
+                    counts = self._add_counts(counts, np.rint(np.bincount(self._bin(depths), weights=lengths)).astype(np.int64))
+
+                idx = self._counts_to_idx(counts)
+                self._cache_put(coverage_file, region, bed_regions, idx)
+
+            record['positions'] = idx[1]
+
+        return idx
+
+    def _run_length_spans(self, coverage_file, region=None, bed_regions=None):
+        """
+        {contig: (starts, ends)} arrays of the investigated spans, or None for the whole file. The
+        spans are only clipped to the contigs if the file has their lengths (bigWig).
+        """
+        if not region and not bed_regions:
+            return None
+
+        lengths = contig_lengths(coverage_file)
+        if region:
+            if lengths is None:
+                contig = region[1:].partition('}')[0] if region.startswith('{') else region.rpartition(':')[0] or region
+                lengths = {contig: np.iinfo(np.int64).max}
+            contig, start, end = self._parse_region(region, lengths)
+            spans = {contig: [(start, end)]}
+        else:
+            spans = read_bed_regions(bed_regions, lengths)
+
+        return {contig: (np.array([start for start, end in contig_spans], dtype=np.int64), np.array([end for start, end in contig_spans], dtype=np.int64))
+                for contig, contig_spans in spans.items()}
+
+    @staticmethod
+    def _covered_lengths(spans, positions):
+        """
+        number of positions of the (sorted, disjoint) spans before each of the given positions
+        """
+        starts, ends = spans
+        cumulative = np.concatenate(([0], np.cumsum(ends - starts)))
+
+        i = np.searchsorted(starts, positions, side='right')
+        previous = np.maximum(i - 1, 0)
+        partial = np.where(i > 0, np.clip(positions - starts[previous], 0, ends[previous] - starts[previous]), 0)
+
+        return cumulative[previous] * (i > 0) + partial
+
+    def _finish_pending(self, bam_file, idx, submitted, region=None, bed_regions=None):
+        if idx is None:
+            # the shards were computed in the background: the stage only times the wait for them
+            with self._stage('bam_file_to_idx', bam_file=bam_file, engine=self.engine, threads=self.threads, cached=False) as record:
+                idx = self._merge_shards(bam_file, submitted, region)
+                self._cache_put(bam_file, region, bed_regions, idx)
+                record['positions'] = idx[1]
+
+        return idx
+
+    @measured
+    def alignment_file_to_histogram(self, alignment_file, region=None, bed_regions=None):
+        """
+        DepthHistogram of an open (indexed) pysam.AlignmentFile, e.g. of a caller that already has
+        the file open: swept by the native engine in this process, whatever the engine and
+        threads, with the read filters and binning of this object. The file is not closed.
+        """
+        if region:
+            bed_regions = None
+
+        return DepthHistogram.from_counts(self._native_alignment_file_to_counts(alignment_file, self._spans(alignment_file, region, bed_regions), region), self.binning)
+
+    def depth_to_histogram(self, depth):
+        """
+        DepthHistogram of a per-base depth array of any integer type (e.g. of another tool),
+        counted with np.bincount - binned if this object has binning
+        """
+        return DepthHistogram.from_depth(depth, self.binning)
+
+    def settings(self):
+        """
+        settings that affect the histogram - part of the cache key and of exported histogram metadata
+        """
+        return {'engine': self.engine, 'skip_zero_depth': self.skip_zero_depth, 'shard': list(self.shard) if self.shard else None,
+                'min_mapq': self.min_mapq, 'min_baseq': self.min_baseq, 'exclude_flags': self.exclude_flags, 'include_flags': self.include_flags,
+                'binning': self.binning.settings() if self.binning else None}
+
+    def fingerprint(self, bam_file, region=None, bed_regions=None):
+        """
+        Checksum of the investigated positions (before sharding) - identical for all shards of a run,
+        None for streams (which can only be read once)
+        """
+        if self.is_stream(bam_file):
+            return None
+
+        if region:
+            bed_regions = None
+
+        with self._open(bam_file) as alignment_file:
+            spans = self._spans(alignment_file, region, bed_regions)
+
+        return hashlib.sha256(json.dumps(list(spans.items())).encode('utf-8')).hexdigest()
+
+    def _stage(self, name, **counters):
+        """
+        context of a stage of self.metrics, or a no-op without metrics
+        """
+        if self.metrics is None:
+            return nullcontext({})
+
+        return self.metrics.stage(name, **counters)
+
+    def _progress(self, bam_file, spans):
+        """
+        progress of a scan of the given spans, or None without progress reporting
+        """
+        if not self.progress:
+            return None
+
+        return Progress(self._progress_label(bam_file), sum(end - start for contig_spans in spans.values() for start, end in contig_spans))
+
+    @staticmethod
+    def _progress_label(bam_file):
+        return 'stdin' if bam_file == '-' else os.path.basename(bam_file)
+
+    def _pool(self, pool=None):
+        """
+        context of the given pool, which is shared with (and shut down by) the caller, or of a new
+        pool of self.threads worker processes
+        """
+        if pool is not None:
+            return nullcontext(pool)
+
+        return ProcessPoolExecutor(self.threads) if self.threads > 1 else ThreadPoolExecutor(1)
+
+    @contextmanager
+    def _open(self, bam_file, mode='rb'):
+        import pysam
+        with self._reference_environment(bam_file):
+            with pysam.AlignmentFile(bam_file, mode, reference_filename=self._reference_filename(bam_file), threads=self.decompression_threads) as alignment_file:
+                yield alignment_file
+
+    def _reference_filename(self, bam_file):
+        """
+        htslib prefers a given FASTA file over the reference cache, so it is passed unless all
+        sequences of the CRAM file are in the cache
+        """
+        return None if self._decodes_from_cache(bam_file) else self.reference
+
+    def _reference_environment(self, bam_file):
+        """
+        context in which htslib (in this process and the processes started in it) finds the
+        sequences in the reference cache, if bam_file is decoded from it
+        """
+        return self.reference_cache.environment() if self._decodes_from_cache(bam_file) else nullcontext()
+
+    def _decodes_from_cache(self, bam_file):
+        """
+        Whether bam_file is a CRAM file with M5 tags of which all sequences are in the reference
+        cache. The cache is only populated (or its sequences marked as recently used) here, once
+        per CRAM file.
+        """
+        if not self.reference or self.reference_cache is None or self.is_stream(bam_file):
+            return False
+
+        if bam_file not in self._decoded_from_cache:
+            with open(bam_file, 'rb') as fh:
+                is_cram = fh.read(4) == b'CRAM'
+
+            md5s = None
+            if is_cram:
+                # the header is decoded without reference
+                import pysam
+                with pysam.AlignmentFile(bam_file, 'rc') as alignment_file:
+                    md5s = [sq.get('M5') for sq in alignment_file.header.to_dict().get('SQ', [])]
+
+            cached = self.reference_cache.populate(self.reference) if md5s and all(md5s) else None
+            self._decoded_from_cache[bam_file] = cached is not None and set(md5s) <= cached
+
+        return self._decoded_from_cache[bam_file]
+
+    @staticmethod
+    def is_stream(bam_file):
+        """
+        stdin ('-') or a named pipe: can only be read once, in order, and has no index
+        """
+        try:
+            return bam_file == '-' or stat.S_ISFIFO(os.stat(bam_file).st_mode)
+        except OSError:
+            return False
+
+    def _cache_get(self, bam_file, region=None, bed_regions=None):
+        if self.cache is not None and not self.is_stream(bam_file):
+            return self.cache.get(self.cache.key(bam_file, region, bed_regions, self.settings()))
+
+    def _cache_put(self, bam_file, region, bed_regions, idx):
+        if self.cache is not None and not self.is_stream(bam_file):
+            self.cache.put(self.cache.key(bam_file, region, bed_regions, self.settings()), *idx)
+
+    @measured
+    def approximate_bam_file_to_idx(self, bam_file, region=None, bed_regions=None, rate=0.01, stratified=False, seed=0, confidence=0.95, pool=None):
+        """
+        Estimates the depth histogram from a random sample (fraction rate) of windows of
+        SAMPLE_WINDOW_SIZE positions - uniformly over all investigated positions or stratified, i.e.
+        with the same rate per contig. The sampled histogram is scaled up by the ratio of
+        investigated to sampled positions (per contig if stratified). The confidence interval of
+        the ROC is obtained by bootstrapping the sampled windows. The windows are swept by the given
+        pool, if the caller shares its own.
+
+        -> (idx_observed, total_investigated_genomic_positions, report)
+        """
+        if region:
+            bed_regions = None
+
+        if self.is_stream(bam_file):
+            raise ValueError(f"Approximate mode requires an indexed alignment file, not a stream: {bam_file}")
+
+        rng = random.Random(seed)
+
+        with self._open(bam_file) as alignment_file:
+            spans = {contig: contig_spans for contig, contig_spans in self._spans(alignment_file, region, bed_regions).items()
+                     if region or self._native_contig_has_reads(alignment_file, contig)}
+
+        windows = [(contig, window_start, min(window_start + self.SAMPLE_WINDOW_SIZE, end))
+                   for contig, contig_spans in spans.items()
+                   for start, end in contig_spans
+                   for window_start in range(start, end, self.SAMPLE_WINDOW_SIZE)]
+
+        if stratified:
+            strata = [[window for window in windows if window[0] == contig] for contig in spans]
+        else:
+            strata = [windows]
+        strata = [stratum for stratum in strata if stratum]
+
+        sampled = [rng.sample(stratum, min(len(stratum), max(1, round(rate * len(stratum))))) for stratum in strata]
+
+        # the sampled windows are swept in coordinate order by the native engine, whatever the
+        # engine: a samtools depth process per window costs more than the exact scan
+        windows_per_contig = {}
+        for i, stratum in enumerate(sampled):
+            for j, (contig, start, end) in enumerate(stratum):
+                windows_per_contig.setdefault(contig, []).append((start, end, i, j))
+
+        sampled_counts = [[None] * len(stratum) for stratum in sampled]
+        progress = Progress(self._progress_label(bam_file), sum(end - start for stratum in sampled for contig, start, end in stratum)) if self.progress else None
+        with self._pool(pool) as pool:
+            submitted = []
+            for contig, contig_windows in windows_per_contig.items():
+                contig_windows.sort()
+                for k in range(0, len(contig_windows), self.SAMPLE_TASK_SIZE):
+                    task = contig_windows[k:k + self.SAMPLE_TASK_SIZE]
+                    submitted.append((task, pool.submit(self._windows_to_counts, bam_file, contig, [(start, end) for start, end, i, j in task])))
+
+            for task, future in submitted:
+                for (start, end, i, j), counts in zip(task, future.result()):
+                    sampled_counts[i][j] = counts
+                if progress:
+                    progress.update(sum(end - start for start, end, i, j in task))
+
+        if progress:
+            progress.finish()
+
+        sizes = [sum(end - start for contig, start, end in stratum) for stratum in strata]
+        sampled_sizes = [[end - start for contig, start, end in stratum] for stratum in sampled]
+
+        # bootstrap: resample the sampled windows with replacement, within each stratum
+        rocs = []
+        for i in range(self.BOOTSTRAP_ITERATIONS):
+            resampled = [[rng.randrange(len(stratum)) for j in range(len(stratum))] for stratum in sampled]
+
+            counts = self._scale_strata(sizes, [[sampled_sizes[k][j] for j in stratum] for k, stratum in enumerate(resampled)],
+                                        [[sampled_counts[k][j] for j in stratum] for k, stratum in enumerate(resampled)])
+            if counts[1:].sum() > 0:
+                depths = self._bin_depths(len(counts))
+                rocs.append(self._roc({depths[i]: counts[i] for i in np.flatnonzero(counts)}))
+
+        counts = self._scale_strata(sizes, sampled_sizes, sampled_counts)
+
+        # round to integer frequencies that still sum up to the number of investigated positions
+        n = sum(sizes)
+        rounded = np.floor(counts).astype(np.int64)
+        rounded[np.argsort(rounded - counts)[:n - int(rounded.sum())]] += 1
+
+        report = {
+            'rate': rate,
+            'sampling': 'stratified' if stratified else 'uniform',
+            'seed': seed,
+            'windows': len(windows),
+            'sampled_windows': sum(len(stratum) for stratum in sampled),
+            'sampled_fraction': 1.0 * sum(sum(stratum) for stratum in sampled_sizes) / n if n else 0.0,
+            'confidence': confidence,
+            'roc_ci': [float(np.quantile(rocs, (1.0 - confidence) / 2)), float(np.quantile(rocs, 1.0 - (1.0 - confidence) / 2))] if rocs else None,
+        }
+
+        idx_observed, n = self._counts_to_idx(rounded)
+        return (idx_observed, n, report)
+
+    def _windows_to_counts(self, bam_file, contig, windows):
+        """
+        depth histogram (dense array) per window, with the native engine
+        """
+        with self._open(bam_file) as alignment_file:
+            return [np.bincount(self._bin(self._native_window_depth(alignment_file, contig, start, end)[0]), minlength=1) for start, end in windows]
+
+    @staticmethod
+    def _scale_strata(sizes, sampled_sizes, sampled_counts):
+        """
+        sum over the strata of the sampled depth histograms, each multiplied by size / sampled size
+        """
+        counts = np.zeros(max((len(window_counts) for stratum_counts in sampled_counts for window_counts in stratum_counts), default=1))
+        for size, stratum_sizes, stratum_counts in zip(sizes, sampled_sizes, sampled_counts):
+            for window_counts in stratum_counts:
+                counts[:len(window_counts)] += window_counts * (1.0 * size / sum(stratum_sizes))
+
+        return counts
+
+    def bam_file_to_region_idx(self, bam_file, bed_regions=None):
+        """
+        {name: (idx_observed, total_investigated_genomic_positions)} per named region of the BED file
+        (4th column), or per contig without a BED file, in a single pass: every window of the union
+        of the regions is fetched and swept once and its depths are counted for all regions that
+        overlap it. Regions may overlap; each region counts all its positions, also without reads
+        (like an explicit region).
+
+        The regions are swept by the native engine, whatever the engine; with threads > 1 the union
+        is split into shards that are processed by a pool of workers.
+        """
+        if self.is_stream(bam_file):
+            raise ValueError(f"Per region histograms require an indexed alignment file, not a stream: {bam_file}")
+
+        with self._open(bam_file) as alignment_file:
+            lengths = dict(zip(alignment_file.references, alignment_file.lengths))
+
+        if bed_regions:
+            regions = read_named_bed_regions(bed_regions, lengths)
+        else:
+            regions = {contig: {contig: [(0, length)]} for contig, length in lengths.items()}
+
+        # per contig the union of the regions and their (start, end, name) intervals in order
+        spans = {}
+        intervals = {}
+        starts = {}
+        longest = {}
+        for contig in lengths:
+            contig_intervals = sorted((start, end, name) for name, region_spans in regions.items() for start, end in region_spans.get(contig, []))
+            if contig_intervals:
+                spans[contig] = merge_intervals([(start, end) for start, end, name in contig_intervals])
+                intervals[contig] = contig_intervals
+                starts[contig] = [start for start, end, name in contig_intervals]
+                longest[contig] = max(end - start for start, end, name in contig_intervals)
+
+        with self._stage('bam_file_to_region_idx', bam_file=bam_file, regions=len(regions)) as record:
+            progress = self._progress(bam_file, spans)
+
+            counts = {}
+            with (ProcessPoolExecutor(self.threads) if self.threads > 1 else ThreadPoolExecutor(1)) as pool:
+                submitted = []
+                for contig, shard in self._shards(spans):
+                    shard_start, shard_end = shard[0][0], shard[-1][1]
+
+                    # only intervals that start less than the longest interval before the shard can overlap it
+                    first = bisect_left(starts[contig], shard_start - longest[contig])
+                    last = bisect_left(starts[contig], shard_end)
+                    shard_intervals = [(max(start, shard_start), min(end, shard_end), name) for start, end, name in intervals[contig][first:last] if end > shard_start]
+                    submitted.append((sum(end - start for start, end in shard), pool.submit(self._named_spans_to_counts, bam_file, contig, shard, shard_intervals)))
+
+                for size, future in submitted:
+                    for name, name_counts in future.result().items():
+                        counts[name] = self._add_counts(counts.get(name, np.zeros(1, dtype=np.int64)), name_counts)
+                    if progress:
+                        progress.update(size)
+
+            if progress:
+                progress.finish()
+
+            record['positions'] = sum(end - start for contig_spans in spans.values() for start, end in contig_spans)
+
+        return {name: self._counts_to_idx(counts[name]) for name in regions}
+
+    def _named_spans_to_counts(self, bam_file, contig, spans, intervals):
+        """
+        Worker function: {name: depth histogram (dense array)} of the named intervals
+        [(start, end, name), ...] (sorted) within the spans of a contig
+        """
+        counts = {}
+        active = []
+        k = 0
+
+        with self._open(bam_file) as alignment_file:
+            for window_start, window_end, window_spans in self._fetch_windows(spans):
+                depth = self._native_window_depth(alignment_file, contig, window_start, window_end)[0]
+
+                while k < len(intervals) and intervals[k][0] < window_end:
+                    active.append(intervals[k])
+                    k += 1
+                active = [interval for interval in active if interval[1] > window_start]
+
+                for start, end, name in active:
+                    start, end = max(start, window_start), min(end, window_end)
+                    if start < end:
+                        counts[name] = self._add_counts(counts.get(name, np.zeros(1, dtype=np.int64)), np.bincount(self._bin(depth[start - window_start:end - window_start])))
+
+        return counts
+
+    def bam_file_to_window_rocs(self, bam_file, window_size, region=None, bed_regions=None):
+        """
+        Yields (contig, start, end, roc) per window of window_size positions (tiles of the contigs
+        starting at 0, clipped to the contig length) in coordinate order, as soon as the windows
+        are finished. Only investigated positions (region, BED) count; windows without any
+        sequenced base are skipped, as their ROC is undefined.
+
+        Windows are swept by the native engine, whatever the engine, and only a bounded number of
+        tasks of windows is in flight: memory does not grow with the size of the genome.
+        """
+        if region:
+            bed_regions = None
+
+        if self.is_stream(bam_file):
+            raise ValueError(f"A window track requires an indexed alignment file, not a stream: {bam_file}")
+
+        with self._open(bam_file) as alignment_file:
+            spans = self._spans(alignment_file, region, bed_regions)
+            lengths = dict(zip(alignment_file.references, alignment_file.lengths))
+
+        with self._stage('bam_file_to_window_rocs', bam_file=bam_file, window_size=window_size) as record:
+            progress = self._progress(bam_file, spans)
+            record['windows'] = 0
+
+            with (ProcessPoolExecutor(self.threads) if self.threads > 1 else ThreadPoolExecutor(1)) as pool:
+                pending = deque()
+                for contig, tiles in self._tile_tasks(spans, window_size, lengths):
+                    pending.append((sum(end - start for tile_start, tile_end, tile_spans in tiles for start, end in tile_spans), pool.submit(self._tiles_to_rocs, bam_file, contig, tiles)))
+
+                    # bounded look-ahead
+                    while len(pending) > 2 * self.threads:
+                        yield from self._finish_tiles(pending.popleft(), progress, record)
+
+                while pending:
+                    yield from self._finish_tiles(pending.popleft(), progress, record)
+
+            if progress:
+                progress.finish()
+
+    def _finish_tiles(self, task, progress, record):
+        size, future = task
+
+        rocs = future.result()
+        if progress:
+            progress.update(size)
+        record['windows'] += len(rocs)
+
+        return rocs
+
+    def _tile_tasks(self, spans, window_size, lengths):
+        """
+        [(contig, tiles), ...] - the tiles of every contig, in tasks of about SHARD_SIZE positions
+        (and at least one tile)
+        """
+        tasks = []
+        for contig, contig_spans in spans.items():
+            task = []
+            size = 0
+            for tile in self._tiles(contig_spans, window_size, lengths[contig]):
+                tile_size = sum(end - start for start, end in tile[2])
+                if task and size + tile_size > self.SHARD_SIZE:
+                    tasks.append((contig, task))
+                    task = []
+                    size = 0
+
+                task.append(tile)
+                size += tile_size
+            if task:
+                tasks.append((contig, task))
+
+        return tasks
+
+    @staticmethod
+    def _tiles(spans, window_size, length):
+        """
+        [(tile_start, tile_end, [(start, end), ...]), ...] - the spans split at multiples of
+        window_size and grouped per tile. Tiles are clipped to the contig length.
+        """
+        tiles = []
+        for start, end in spans:
+            while start < end:
+                tile_start = start - start % window_size
+                piece_end = min(end, tile_start + window_size)
+
+                if tiles and tiles[-1][0] == tile_start:
+                    tiles[-1][2].append((start, piece_end))
+                else:
+                    tiles.append((tile_start, min(tile_start + window_size, length), [(start, piece_end)]))
+                start = piece_end
+
+        return tiles
+
+    def _tiles_to_rocs(self, bam_file, contig, tiles):
+        """
+        Worker function: [(contig, tile_start, tile_end, roc), ...] of the tiles with sequenced bases
+        """
+        rocs = []
+
+        with self._open(bam_file) as alignment_file:
+            for tile_start, tile_end, spans in tiles:
+                counts = self._native_spans_to_counts(alignment_file, contig, spans)[0]
+                if counts[1:].any():
+                    rocs.append((contig, tile_start, tile_end, self._roc(self._counts_to_idx(counts)[0])))
+
+        return rocs
+
+    def _stream_to_idx(self, bam_file, region=None, bed_regions=None):
+        """
+        Single pass over a coordinate sorted SAM/BAM stream. The depth of all positions before the
+        start of the current read is final: every WINDOW_SIZE positions it is flushed into the
+        histogram, so only the alignment blocks that overlap the current window are kept in memory.
+        """
+        if self.shard:
+            raise ValueError(f"Sharding requires an indexed alignment file, not a stream: {bam_file}")
+
+        counts = np.zeros(1, dtype=np.int64)
+
+        with self._open(bam_file, 'r') as alignment_file:
+            spans = self._spans(alignment_file, region, bed_regions)
+            lengths = dict(zip(alignment_file.references, alignment_file.lengths))
+            progress = self._progress(bam_file, spans)
+
+            finished = set()
+            contig = None
+            start = 0
+            position = 0
+            carry = 0
+            block_starts = []
+            block_ends = []
+            for read in alignment_file.fetch(until_eof=True):
+                if not self._passes_filter(read) or read.reference_name not in spans:
+                    continue
+
+                if read.reference_name != contig:
+                    if contig is not None:
+                        counts = self._add_counts(counts, self._stream_flush(spans[contig], start, lengths[contig], carry, block_starts, block_ends)[0])
+                        finished.add(contig)
+                        if progress:
+                            progress.update(sum(span_end - span_start for span_start, span_end in self._clip_spans(spans[contig], start, lengths[contig])))
+
+                    if read.reference_name in finished:
+                        raise ValueError(f"Alignment stream is not coordinate sorted: {read.reference_name} occurs after {contig}")
+
+                    contig = read.reference_name
+                    start = 0
+                    carry = 0
+                    block_starts = []
+                    block_ends = []
+                elif read.reference_start < position:
+                    raise ValueError(f"Alignment stream is not coordinate sorted: {contig}:{read.reference_start + 1} occurs after {contig}:{position + 1}")
+
+                position = read.reference_start
+                if position - start >= self.WINDOW_SIZE:
+                    window_counts, carry, block_starts, block_ends = self._stream_flush(spans[contig], start, position, carry, block_starts, block_ends)
+                    counts = self._add_counts(counts, window_counts)
+                    if progress:
+                        progress.update(sum(span_end - span_start for span_start, span_end in self._clip_spans(spans[contig], start, position)))
+                    start = position
+
+                for block_start, block_end in self._read_blocks(read):
+                    block_starts.append(block_start)
+                    block_ends.append(block_end)
+
+            if contig is not None:
+                counts = self._add_counts(counts, self._stream_flush(spans[contig], start, lengths[contig], carry, block_starts, block_ends)[0])
+                finished.add(contig)
+
+        # like samtools depth -a: contigs without reads only count if they were explicitly selected
+        if region:
+            for contig in spans:
+                if contig not in finished:
+                    counts[0] += sum(end - start for start, end in spans[contig])
+
+        if progress:
+            progress.finish()
+
+        return self._counts_to_idx(counts)
+
+    def _stream_flush(self, contig_spans, start, end, carry, block_starts, block_ends):
+        """
+        Depth histogram of the investigated positions in [start, end), given the number of blocks
+        that cover start (carry) and the blocks that start at or after start. Returns the histogram
+        and the carry and blocks for [end, ...).
+
+        The depth is computed in pieces of at most WINDOW_SIZE positions; stretches without any
+        block are added as zero depth in one step.
+        """
+        block_starts = np.array(block_starts, dtype=np.int64)
+        block_ends = np.array(block_ends, dtype=np.int64)
+
+        counts = np.zeros(1, dtype=np.int64)
+        while start < end:
+            if carry == 0:
+                gap_end = min(end, int(block_starts.min())) if len(block_starts) else end
+                if gap_end > start:
+                    counts[0] += sum(span_end - span_start for span_start, span_end in self._clip_spans(contig_spans, start, gap_end))
+                    start = gap_end
+                    continue
+
+            piece_end = min(end, start + self.WINDOW_SIZE)
+            size = piece_end - start
+
+            difference = np.bincount(block_starts[block_starts < piece_end] - start, minlength=size + 1) - np.bincount(block_ends[block_ends < piece_end] - start, minlength=size + 1)
+            depth = carry + np.cumsum(difference[:size])
+
+            for span_start, span_end in self._clip_spans(contig_spans, start, piece_end):
+                counts = self._add_counts(counts, np.bincount(self._bin(depth[span_start - start:span_end - start])))
+
+            carry += int((block_starts < piece_end).sum()) - int((block_ends < piece_end).sum())
+            block_starts = block_starts[block_starts >= piece_end]
+            block_ends = block_ends[block_ends >= piece_end]
+            start = piece_end
+
+        return (counts, carry, block_starts.tolist(), block_ends.tolist())
+
+    @staticmethod
+    def _clip_spans(contig_spans, start, end):
+        """
+        the parts of the (sorted, disjoint) spans within [start, end)
+        """
+        first = bisect_right(contig_spans, (start, float('inf')))
+        if first > 0 and contig_spans[first - 1][1] > start:
+            first -= 1
+
+        clipped = []
+        while first < len(contig_spans) and contig_spans[first][0] < end:
+            clipped.append((max(contig_spans[first][0], start), min(contig_spans[first][1], end)))
+            first += 1
+
+        return clipped
+
+    def _samtools_bam_file_to_idx(self, bam_file, region=None, bed_regions=None):
+        progress = None
+        if bed_regions or self.skip_zero_depth or self.progress:
+            with self._open(bam_file) as alignment_file:
+                spans = self._spans(alignment_file, region, bed_regions)
+                progress = self._progress(bam_file, spans)
+
+                positions = 0
+                if self.skip_zero_depth:
+                    for contig, contig_spans in spans.items():
+                        if region or self._native_contig_has_reads(alignment_file, contig):
+                            positions += sum(end - start for start, end in contig_spans)
+
+        # samtools gets the normalized (sorted and merged) BED regions
+        counts = self._samtools_depth_to_counts(bam_file, region, spans if bed_regions else None, progress)
+
+        if self.skip_zero_depth:
+            counts[0] = positions - counts[1:].sum()
+
+        if progress:
+            progress.finish()
+
+        return self._counts_to_idx(counts)
+
+    def _samtools_depth_to_counts(self, bam_file, region=None, bed_spans=None, progress=None):
+        """
+        Dense depth array of the `samtools depth` output - without zero depth positions if skip_zero_depth
         """
 
         # nicer way to ctrl killing the child process first and not have hangs with ctrl c
         # https://stackoverflow.com/questions/11312525/catch-ctrlc-sigint-and-exit-multiprocesses-gracefully-in-python
 
-        total_investigated_genomic_positions = 0
-        idx_observed = defaultdict(int)
-
         # FIFO stream / named pipe instead of actual file - saves humongous amounts of disk space for temp files
-        tmp_filename = os.path.join(tempfile.mkdtemp() + '.fifo')
+        tmp_dir = tempfile.mkdtemp()
+        tmp_filename = os.path.join(tmp_dir, 'depth.fifo')
 
         try:
             os.mkfifo(tmp_filename)
 
-            cmd = ['-a', bam_file]
+            cmd = [bam_file] if self.skip_zero_depth else ['-a', bam_file]
+            if self._reference_filename(bam_file):
+                cmd = ['--reference', self._reference_filename(bam_file)] + cmd
+            if self.decompression_threads > 1:
+                cmd = ['-@', str(self.decompression_threads - 1)] + cmd
+            cmd = self._samtools_filter_args() + cmd
             if region:
                 cmd = ['-r', region] + cmd
-            elif bed_regions:
-                cmd = ['-b', bed_regions] + cmd
+            if bed_spans:
+                bed_filename = os.path.join(tmp_dir, 'regions.bed')
+                with open(bed_filename, 'w') as fh:
+                    write_bed_regions(bed_spans, fh)
+                cmd = ['-b', bed_filename] + cmd
 
             # I tried this with the Threading class but this often didnt parallelize
-            parallel_thread = Process(target=pysam.samtools.depth, args=cmd, kwargs={'save_stdout': tmp_filename})
-            parallel_thread.start()
+            import pysam
+            with self._stage('samtools_spawn'), self._reference_environment(bam_file):
+                parallel_thread = Process(target=pysam.samtools.depth, args=cmd, kwargs={'save_stdout': tmp_filename})
+                parallel_thread.start()
 
-            fh = os.open(tmp_filename, os.O_RDONLY)
             try:
-                chunk = os.read(fh, self.READ_BUFFER_SIZE).decode('ascii')
-                while chunk:
-                    split = chunk.split('\n')
-
-                    if chunk[-1] == '\n':
-                        lines = split
-                        chunk = os.read(fh, self.READ_BUFFER_SIZE).decode('ascii')
-                    else:
-                        lines = split[:-1]
-                        chunk = split[-1] + os.read(fh, self.READ_BUFFER_SIZE).decode('ascii')
-
-                    for line in lines:
-                        if line:  # last line is empty line ('')
-                            total_investigated_genomic_positions += 1
-                            idx_observed[int(line.rpartition('\t')[2])] += 1
+                with self._stage('samtools_depth_read') as record, open(tmp_filename, 'rb', buffering=0) as fh:
+                    counts = self._depth_stream_to_counts(fh, record, progress)
             finally:
-                os.close(fh)
                 parallel_thread.terminate()
                 parallel_thread.join()
         finally:
-            os.remove(tmp_filename)
+            shutil.rmtree(tmp_dir)
+
+        if self.skip_zero_depth:
+            # without -a, positions in deletions and reference skips within reads are still reported
+            counts[0] = 0
+
+        return counts
+
+    def _samtools_filter_args(self):
+        args = []
+        if self.exclude_flags != self.DEFAULT_EXCLUDE_FLAGS:
+            # -g drops flags from the default filter, -G adds flags to it
+            args += ['-g', str(self.DEFAULT_EXCLUDE_FLAGS), '-G', str(self.exclude_flags)]
+        if self.include_flags:
+            args += ['--incl-flags', str(self.include_flags)]
+        if self.min_mapq:
+            args += ['-Q', str(self.min_mapq)]
+        if self.min_baseq:
+            args += ['-q', str(self.min_baseq)]
+
+        return args
+
+    def _depth_stream_to_counts(self, stream, record=None, progress=None):
+        """
+        Counts the last column of a tab separated (samtools depth) byte stream as dense depth array,
+        parsed chunk by chunk (blc.lines).
+
+        The number of bytes read and lines parsed are added to record (dict), if given, and every
+        chunk of lines (positions) is reported to progress.
+        """
+        counts = np.zeros(1, dtype=np.int64)
+
+        for chunk, newlines in read_line_chunks(stream, self.READ_BUFFER_SIZE, record):
+            counts = self._add_counts(counts, np.bincount(self._bin(self._parse_last_column(chunk, newlines))))
+            if progress:
+                progress.update(len(newlines))
+
+        return counts
+
+    @staticmethod
+    def _parse_last_column(chunk, newlines):
+        """
+        Integer values of the last tab separated column of each line ending at the given newline
+        positions
+        """
+        line_starts = np.concatenate(([0], newlines[:-1] + 1))
+        nonempty = newlines > line_starts
+        newlines = newlines[nonempty]
+        line_starts = line_starts[nonempty]
+
+        tabs = np.flatnonzero(chunk == ord('\t'))
+        if len(tabs) > 0:
+            last_tabs = tabs[np.maximum(np.searchsorted(tabs, newlines) - 1, 0)] + 1
+            column_starts = np.where(last_tabs > line_starts, last_tabs, line_starts)
+        else:
+            column_starts = line_starts
+
+        if np.any(newlines == column_starts):
+            raise ValueError("Missing depth value in samtools depth output")
+
+        values = parse_integers(chunk, column_starts, newlines)
+        if values is None:
+            raise ValueError("Invalid depth value in samtools depth output")
+
+        return values
+
+    def _native_bam_file_to_idx(self, bam_file, region=None, bed_regions=None):
+        """
+        Sweeps a difference array over the aligned blocks of each read, window by window, and
+        counts the resulting depths with np.bincount. No per-position text is produced.
+
+        Mimics `samtools depth -a`: contigs without any (filter passing) read are skipped unless
+        they are explicitly requested with a region.
+        """
+        with self._open(bam_file) as alignment_file:
+            spans = self._spans(alignment_file, region, bed_regions)
+            progress = self._progress(bam_file, spans)
+
+            counts = self._native_alignment_file_to_counts(alignment_file, spans, region, progress)
+
+        if progress:
+            progress.finish()
+
+        return self._counts_to_idx(counts)
+
+    def _native_alignment_file_to_counts(self, alignment_file, all_spans, region=None, progress=None):
+        counts = np.zeros(1, dtype=np.int64)
+
+        for contig, spans in all_spans.items():
+            contig_counts, has_reads = self._native_spans_to_counts(alignment_file, contig, spans, progress)
+
+            if region or has_reads or self._native_contig_has_reads(alignment_file, contig):
+                counts = self._add_counts(counts, contig_counts)
+
+        return counts
+
+    def _native_spans_to_counts(self, alignment_file, contig, spans, progress=None):
+        counts = np.zeros(1, dtype=np.int64)
+        has_reads = False
+
+        for window_start, window_end, window_spans in self._fetch_windows(spans):
+            depth, window_has_reads = self._native_window_depth(alignment_file, contig, window_start, window_end)
+
+            if len(window_spans) > 1:
+                depth = np.concatenate([depth[start - window_start:end - window_start] for start, end in window_spans])
+
+            counts = self._add_counts(counts, np.bincount(self._bin(depth)))
+            has_reads = has_reads or window_has_reads
+
+            if progress:
+                progress.update(len(depth))
+
+        return (counts, has_reads)
+
+    def _fetch_windows(self, spans):
+        """
+        Yields (window_start, window_end, spans) - spans closer than FETCH_GAP to each other share a
+        window of at most WINDOW_SIZE, so that nearby (e.g. exome) targets take one index lookup and
+        sweep instead of one each. Longer spans are split over multiple windows.
+        """
+        window = []
+        for start, end in spans:
+            for piece_start in range(start, end, self.WINDOW_SIZE):
+                piece_end = min(piece_start + self.WINDOW_SIZE, end)
+
+                if window and (piece_start - window[-1][1] > self.FETCH_GAP or piece_end - window[0][0] > self.WINDOW_SIZE):
+                    yield (window[0][0], window[-1][1], window)
+                    window = []
+
+                window.append((piece_start, piece_end))
+
+        if window:
+            yield (window[0][0], window[-1][1], window)
+
+    def _submit_shards(self, pool, bam_file, region=None, bed_regions=None):
+        """
+        Splits the investigated spans into shards of about SHARD_SIZE positions and submits the
+        computation of their depth histograms to the pool
+        """
+        with self._open(bam_file) as alignment_file:
+            spans = self._spans(alignment_file, region, bed_regions)
+
+        if self.shard:
+            spans = self._shard_spans(spans, *self.shard)
+
+        return (spans, [(contig, sum(end - start for start, end in shard), pool.submit(self._shard_to_counts, bam_file, contig, shard)) for contig, shard in self._shards(spans)],
+                self._progress(bam_file, spans))
+
+    def _merge_shards(self, bam_file, submitted, region=None):
+        """
+        Sums up the shard histograms per contig, once they are finished
+        """
+        spans, futures, progress = submitted
+
+        with self._open(bam_file) as alignment_file:
+            contig_counts = {}
+            for contig, size, future in futures:
+                contig_counts[contig] = self._add_counts(contig_counts.get(contig, np.zeros(1, dtype=np.int64)), future.result())
+                if progress:
+                    progress.update(size)
+
+            counts = np.zeros(1, dtype=np.int64)
+            for contig in spans:
+                if region or self._native_contig_has_reads(alignment_file, contig):
+                    counts = self._add_counts(counts, contig_counts.get(contig, np.zeros(1, dtype=np.int64)))
+
+        if progress:
+            progress.finish()
 
-        return (dict(idx_observed), total_investigated_genomic_positions)
+        return self._counts_to_idx(counts)
+
+    def _shard_to_counts(self, bam_file, contig, spans):
+        """
+        Worker function: depth histogram of the given spans (0-based, half open) of a contig
+        """
+        if self.engine == 'native':
+            with self._open(bam_file) as alignment_file:
+                return self._native_spans_to_counts(alignment_file, contig, spans)[0]
+
+        # a shard of BED regions gets only its own spans, instead of every shard parsing the complete BED file
+        counts = self._samtools_depth_to_counts(bam_file, self._region_string(contig, spans[0][0], spans[-1][1]), {contig: spans} if len(spans) > 1 else None)
+
+        if self.skip_zero_depth:
+            counts[0] = sum(end - start for start, end in spans) - counts[1:].sum()
+
+        return counts
+
+    def _shards(self, spans):
+        """
+        [(contig, [(start, end), ...]), ...] - consecutive spans of a contig are grouped, and long
+        spans are split, such that every shard covers at most SHARD_SIZE positions
+        """
+        shards = []
+        for contig, contig_spans in spans.items():
+            shard = []
+            size = 0
+            for start, end in contig_spans:
+                for shard_start in range(start, end, self.SHARD_SIZE):
+                    shard_end = min(shard_start + self.SHARD_SIZE, end)
+                    if size + shard_end - shard_start > self.SHARD_SIZE:
+                        shards.append((contig, shard))
+                        shard = []
+                        size = 0
+
+                    shard.append((shard_start, shard_end))
+                    size += shard_end - shard_start
+            if shard:
+                shards.append((contig, shard))
+
+        return shards
+
+    @staticmethod
+    def _shard_spans(spans, index, count):
+        """
+        Spans of the index-th (1-based) of count parts of equal size, with all spans of all contigs
+        laid out after each other in header order
+        """
+        total = sum(end - start for contig_spans in spans.values() for start, end in contig_spans)
+        shard_start = (index - 1) * total // count
+        shard_end = index * total // count
+
+        shard_spans = {}
+        offset = 0
+        for contig, contig_spans in spans.items():
+            for start, end in contig_spans:
+                overlap_start = max(shard_start - offset, 0)
+                overlap_end = min(shard_end - offset, end - start)
+                if overlap_start < overlap_end:
+                    shard_spans.setdefault(contig, []).append((start + overlap_start, start + overlap_end))
+                offset += end - start
+
+        return shard_spans
+
+    def _spans(self, alignment_file, region=None, bed_regions=None):
+        """
+        {contig: [(start, end), ...]} (0-based, half open) of the positions that are investigated
+        """
+        lengths = dict(zip(alignment_file.references, alignment_file.lengths))
+
+        if region:
+            contig, start, end = self._parse_region(region, lengths)
+            return {contig: [(start, end)]}
+        elif bed_regions:
+            return read_bed_regions(bed_regions, lengths)
+        else:
+            return {contig: [(0, length)] for contig, length in lengths.items()}
+
+    def _native_window_depth(self, alignment_file, contig, start, end):
+        """
+        Per-base depth of [start, end) (0-based, half open) as array, and whether any read passed
+        the filter. Only M/=/X blocks count: deletions and reference skips (N) are not covered.
+        """
+        block_starts = []
+        block_ends = []
+        has_reads = False
+
+        for read in alignment_file.fetch(contig, start, end):
+            if self._passes_filter(read):
+                has_reads = True
+                for block_start, block_end in self._read_blocks(read):
+                    block_starts.append(block_start)
+                    block_ends.append(block_end)
+
+        size = end - start
+        block_starts = np.clip(np.array(block_starts, dtype=np.int64) - start, 0, size)
+        block_ends = np.clip(np.array(block_ends, dtype=np.int64) - start, 0, size)
+
+        difference = np.bincount(block_starts, minlength=size + 1) - np.bincount(block_ends, minlength=size + 1)
+
+        return (np.cumsum(difference[:size]), has_reads)
+
+    def _native_contig_has_reads(self, alignment_file, contig):
+        for read in alignment_file.fetch(contig):
+            if self._passes_filter(read):
+                return True
+
+        return False
+
+    def _passes_filter(self, read):
+        flag = read.flag
+        return not flag & self.exclude_flags and (not self.include_flags or flag & self.include_flags) and read.mapping_quality >= self.min_mapq
+
+    def _read_blocks(self, read):
+        """
+        Aligned (M/=/X) blocks of a read in reference coordinates - with min_baseq split into the
+        runs of bases that have a sufficient base quality.
+        """
+        qualities = read.query_qualities
+        if not self.min_baseq or qualities is None:
+            return read.get_blocks()
+
+        blocks = []
+        reference_position = read.reference_start
+        query_position = 0
+        for operation, length in read.cigartuples:
+            if operation in self.CIGAR_ALIGNED:
+                passed = np.frombuffer(qualities, dtype=np.uint8, count=length, offset=query_position) >= self.min_baseq
+                edges = np.flatnonzero(np.diff(np.concatenate(([False], passed, [False])).astype(np.int8)))
+                blocks.extend(zip((reference_position + edges[0::2]).tolist(), (reference_position + edges[1::2]).tolist()))
+
+                reference_position += length
+                query_position += length
+            elif operation in self.CIGAR_QUERY:
+                query_position += length
+            elif operation in self.CIGAR_REFERENCE:
+                reference_position += length
+
+        return blocks
+
+    def _counts_to_idx(self, counts):
+        """
+        dense depth (or bin) array -> (idx_observed, total_investigated_genomic_positions)
+        """
+        depths = self._bin_depths(len(counts))
+        return ({int(depths[i]): int(counts[i]) for i in np.flatnonzero(counts)}, int(counts.sum()))
+
+    def _bin(self, depth):
+        """
+        depth array -> index into dense arrays of frequencies: the depth itself, or its bin
+        """
+        return self.binning.index(depth) if self.binning else depth
+
+    def _bin_depths(self, n):
+        """
+        depth of each of the first n entries of dense arrays of frequencies
+        """
+        return self.binning.depths(n) if self.binning else np.arange(n)
+
+    @staticmethod
+    def _region_string(contig, start, end):
+        if ':' in contig:
+            contig = '{' + contig + '}'
+
+        return f"{contig}:{start + 1}-{end}"
+
+    @staticmethod
+    def _add_counts(counts, other):
+        if len(other) > len(counts):
+            counts, other = other.astype(np.int64), counts
+
+        counts[:len(other)] += other
+        return counts
+
+    @staticmethod
+    def _parse_region(region, lengths):
+        """
+        'chr', 'chr:from' or 'chr:from-to' (1-based, inclusive) -> (chr, start, end) (0-based, half open)
+        """
+        if region in lengths:
+            contig, positions = region, ''
+        elif region.startswith('{'):
+            contig, _, positions = region[1:].partition('}')
+            positions = positions[1:]
+        else:
+            contig, _, positions = region.rpartition(':')
+
+        if contig not in lengths:
+            raise ValueError(f"Region not found in alignment header: {region}")
+
+        start, _, end = positions.replace(',', '').partition('-')
+        start = max(int(start) - 1, 0) if start else 0
+        end = min(int(end), lengths[contig]) if end else lengths[contig]
+
+        return (contig, start, max(start, end))
 
     @deprecated
     def bam_file_to_idx_slow_and_mem_unsafe(self, bam_file):
         """
         Coverage plot needs the zero-statistic - i.e. the number of genomic bases not covered by reads
         """
+        import pysam
         idx_observed = {}
         depth = ''
         status = 0
@@ -114,6 +1335,7 @@ class BamLorenzCoverage:
         """
         Coverage plot needs the zero-statistic - i.e. the number of genomic bases not covered by reads
         """
+        import pysam
         from tqdm import tqdm
         idx_observed = {}
         for line in tqdm(pysam.samtools.depth('-a', bam_file, split_lines=True)):
@@ -172,6 +1394,7 @@ class BamLorenzCoverage:
 
         return (idx_observed, size_investigated_region)
 
+    @measured
     def estimate_cumulative_coverage_curves(self, idx_observed):
         """
         IN:
@@ -190,36 +1413,36 @@ class BamLorenzCoverage:
 
         -----
 
-        work top-down to save accumulated positions
+        work top-down (reverse cumulative sum) to save accumulated positions
         """
-        cumulative_coverage_curves = {'minimum_coverage_depth': [], 'percentage_genome_covered': []}
+        depths, frequencies = self._histogram_arrays(idx_observed)
 
-        idx_observed_cumulative = {}
-        accumulation = 0
-        for key in sorted(idx_observed, reverse=True):
-            accumulation += idx_observed[key]
-            idx_observed_cumulative[key] = accumulation
+        idx_observed_cumulative = np.cumsum(frequencies[::-1])[::-1]
+        accumulation = idx_observed_cumulative[0] if len(depths) else 0
+        if len(depths) and not accumulation:
+            raise ZeroDivisionError("no genomic positions in histogram")
 
-        for min_depth in sorted(idx_observed_cumulative):
-            cumulative_coverage_curves['minimum_coverage_depth'].append(min_depth)
-            cumulative_coverage_curves['percentage_genome_covered'].append(100.0 * idx_observed_cumulative[min_depth] / accumulation)
+        return {'minimum_coverage_depth': depths.tolist(),
+                'percentage_genome_covered': (100.0 * idx_observed_cumulative.astype(np.float64) / float(accumulation)).tolist()}
 
-        return cumulative_coverage_curves
-
-    def export_cumulative_coverage_curves(self, cumulative_coverage_curves, output_stream):
+    @measured
+    def export_cumulative_coverage_curves(self, cumulative_coverage_curves, output_stream, max_points=None):
         output_stream.write("X_minimum_coverage_depth\tY_percentage_genome_covered\n")
-        for depth, pct in zip(cumulative_coverage_curves['minimum_coverage_depth'], cumulative_coverage_curves['percentage_genome_covered']):
+        for depth, pct in zip(*self.reduce_curve(cumulative_coverage_curves['minimum_coverage_depth'], cumulative_coverage_curves['percentage_genome_covered'], max_points)):
             output_stream.write(f"{depth}\t{pct}\n")
 
-    def export_cumulative_coverage_plot(self, cumulative_coverage_curves, output_file, min_percentage_covered=0.5):
+    @measured
+    def export_cumulative_coverage_plot(self, cumulative_coverage_curves, output_file, min_percentage_covered=0.5, max_points=None):
+        fig = figure()
+        ax = fig.add_subplot()
         n = sum(1 for x in cumulative_coverage_curves['percentage_genome_covered'] if x >= min_percentage_covered)
 
-        plt.plot(cumulative_coverage_curves['minimum_coverage_depth'][1:n], cumulative_coverage_curves['percentage_genome_covered'][1:n], '-bo')
-        plt.xlabel('Minimum coverage depth')
-        plt.ylabel(f'Percenatge genome covered (>= {round(min_percentage_covered, 1)}%)')
-        plt.savefig(output_file)
-        plt.gcf().clear()
+        ax.plot(*self.reduce_curve(cumulative_coverage_curves['minimum_coverage_depth'][1:n], cumulative_coverage_curves['percentage_genome_covered'][1:n], max_points), '-bo')
+        ax.set_xlabel('Minimum coverage depth')
+        ax.set_ylabel(f'Percenatge genome covered (>= {round(min_percentage_covered, 1)}%)')
+        fig.savefig(output_file)
 
+    @measured
     def estimate_lorenz_curves(self, idx_observed):
         """
         In:
@@ -252,43 +1475,31 @@ cumu_bases = 0+2+8+3 = 13
         (denominator is covered positions only, i.e. depth > 0; ensures curve ends at (1,1))
 
         """
-        lorenz_idx = {}
-
-        previous_depth = None
-        cumu_positions = 0
-        cumulative_sequenced_bases = 0
+        depths, frequencies = self._histogram_arrays(idx_observed)
 
-        for depth in sorted(idx_observed, reverse=True):
-            if depth != 0:
-                positions = idx_observed[depth]
-                sequenced_bases = idx_observed[depth] * depth
+        # covered positions only, deepest first
+        covered = depths != 0
+        depths = depths[covered][::-1]
+        frequencies = frequencies[covered][::-1]
 
-                cumu_positions = positions
-                cumulative_sequenced_bases = sequenced_bases
-                if previous_depth:
-                    cumu_positions += lorenz_idx[previous_depth][0]
-                    cumulative_sequenced_bases += lorenz_idx[previous_depth][1]
-                lorenz_idx[depth] = [cumu_positions, cumulative_sequenced_bases]
+        # the integer maths below is exact as long as it fits in int64, beyond that python ints are used
+        if frequencies.dtype.kind != 'f' and 2.0 * np.dot(depths.astype(np.float64), frequencies) * frequencies.sum(dtype=np.float64) >= 2 ** 62:
+            depths = depths.astype(object)
+            frequencies = frequencies.astype(object)
 
-                previous_depth = depth
+        sequenced_bases = depths * frequencies
+        cumulative_positions = np.cumsum(frequencies)
+        cumulative_sequenced_bases = np.cumsum(sequenced_bases)
 
-        total_covered_positions_of_genome = cumu_positions
-        total_sequenced_bases = cumulative_sequenced_bases
-
-        previous = [0, 0]
-        top = 0
+        total_covered_positions_of_genome = self._scalar(cumulative_positions[-1]) if len(depths) else 0
+        total_sequenced_bases = self._scalar(cumulative_sequenced_bases[-1]) if len(depths) else 0
         denom = total_sequenced_bases * total_covered_positions_of_genome * 2
 
-        lorenz_curves = {'fraction_reads': [0.0], 'fraction_genome': [0.0]}
-        for depth in sorted(lorenz_idx, reverse=True):
-            if depth != 0:
-                lorenz_curves['fraction_reads'].append(round(1.0 * lorenz_idx[depth][1] / total_sequenced_bases, 4))
-                lorenz_curves['fraction_genome'].append(round(1.0 * lorenz_idx[depth][0] / total_covered_positions_of_genome, 4))
-
-                top += (lorenz_idx[depth][1] - previous[1]) * (lorenz_idx[depth][0] - previous[0])
-                top += (lorenz_idx[depth][1] - previous[1]) * (previous[0]) * 2
+        # twice the area under the curve, in units of 1 / (total_sequenced_bases * total_covered_positions_of_genome)
+        top = self._scalar(np.sum(sequenced_bases * (frequencies + 2 * (cumulative_positions - frequencies))))
 
-                previous = lorenz_idx[depth]
+        lorenz_curves = {'fraction_reads': [0.0] + self._round(cumulative_sequenced_bases.astype(np.float64) / float(total_sequenced_bases or 1), 4).tolist(),
+                         'fraction_genome': [0.0] + self._round(cumulative_positions.astype(np.float64) / float(total_covered_positions_of_genome or 1), 4).tolist()}
 
         roc = 1.0 * top / denom
 
@@ -297,16 +1508,92 @@ cumu_bases = 0+2+8+3 = 13
         lorenz_curves['total_covered_positions_of_genome'] = total_covered_positions_of_genome
         return lorenz_curves
 
-    def export_lorenz_curves(self, lorenz_curves, output_stream):
+    def _roc(self, idx_observed):
+        """
+        ROC of the Lorenz curve, for many small histograms: not measured, as a metrics stage per
+        histogram would swamp the metrics
+        """
+        return self.estimate_lorenz_curves.__wrapped__(self, idx_observed)['roc']
+
+    @staticmethod
+    def _histogram_arrays(idx_observed):
+        """
+        (depths, frequencies) as arrays, by ascending depth - from idx_observed, a DepthHistogram or
+        a dense array of frequencies indexed by depth
+        """
+        if isinstance(idx_observed, np.ndarray):
+            depths = np.flatnonzero(idx_observed)
+            return (depths, idx_observed[depths])
+
+        if isinstance(idx_observed, DepthHistogram):
+            return (idx_observed.depths, idx_observed.frequencies)
+
+        depths = np.fromiter(idx_observed.keys(), dtype=np.int64, count=len(idx_observed))
+        frequencies = np.array(list(idx_observed.values()))
+        if not len(frequencies):
+            frequencies = frequencies.astype(np.int64)
+
+        order = np.argsort(depths, kind='stable')
+        return (depths[order], frequencies[order])
+
+    @staticmethod
+    def _scalar(value):
+        """
+        numpy scalar -> python int / float (python ints of object arrays are returned as is)
+        """
+        return value.item() if isinstance(value, np.generic) else value
+
+    @staticmethod
+    def _round(values, digits):
+        """
+        np.round, identical to python its round(): that rounds the exact binary value, which
+        differs from rounding the (inexactly) scaled value for values very close to halfway
+        """
+        scaled = values * 10 ** digits
+        rounded = np.round(scaled) / 10 ** digits
+
+        halfway = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+        rounded[halfway] = [round(value, digits) for value in values[halfway].tolist()]
+
+        return rounded
+
+    @measured
+    def export_lorenz_curves(self, lorenz_curves, output_stream, max_points=None):
         output_stream.write("X-fraction-sequenced-bases\tY-fraction-genome-covered\n")
-        for reads, genome in zip(lorenz_curves['fraction_reads'], lorenz_curves['fraction_genome']):
+        for reads, genome in zip(*self.reduce_curve(lorenz_curves['fraction_reads'], lorenz_curves['fraction_genome'], max_points)):
             output_stream.write(f"{reads}\t{genome}\n")
 
-    def export_lorenz_plot(self, lorenz_curves, output_file, sign_digits=3):
-        plt.plot([0.0, 1.0], [0.0, 1.0], 'k--')
-        plt.plot(lorenz_curves['fraction_reads'], lorenz_curves['fraction_genome'], '-bo')
-        plt.text(0.0, 0.95, f"ROC={lorenz_curves['roc']:.{sign_digits}f}", fontsize=14)
-        plt.xlabel('Fraction sequenced bases')
-        plt.ylabel('Fraction covered genome')
-        plt.savefig(output_file)
-        plt.gcf().clear()
+    @measured
+    def export_lorenz_plot(self, lorenz_curves, output_file, sign_digits=3, max_points=None):
+        fig = figure()
+        ax = fig.add_subplot()
+        ax.plot([0.0, 1.0], [0.0, 1.0], 'k--')
+        ax.plot(*self.reduce_curve(lorenz_curves['fraction_reads'], lorenz_curves['fraction_genome'], max_points), '-bo')
+        ax.text(0.0, 0.95, f"ROC={lorenz_curves['roc']:.{sign_digits}f}", fontsize=14)
+        ax.set_xlabel('Fraction sequenced bases')
+        ax.set_ylabel('Fraction covered genome')
+        fig.savefig(output_file)
+
+    @staticmethod
+    def reduce_curve(xs, ys, max_points=None):
+        """
+        At most max_points (>= 2) points of the curve, picked at equal distances along the curve (with both
+        axes scaled to [0, 1]): the selected points are exact points of the curve, they are dense
+        where it bends and sparse where it is straight. The first and last point are always kept.
+
+        The ROC of a Lorenz curve is computed on the full resolution histogram and is not affected.
+
+        -> (xs, ys)
+        """
+        if max_points is None or len(xs) <= max_points:
+            return (list(xs), list(ys))
+
+        x = np.asarray(xs, dtype=np.float64)
+        y = np.asarray(ys, dtype=np.float64)
+
+        distance = np.hypot(np.diff(x) / ((x.max() - x.min()) or 1.0), np.diff(y) / ((y.max() - y.min()) or 1.0))
+        position = np.concatenate(([0.0], np.cumsum(distance)))
+
+        selected = np.unique(np.concatenate(([0, len(x) - 1], np.searchsorted(position, np.linspace(0.0, position[-1], max_points)[1:-1]))))
+
+        return ([xs[i] for i in selected.tolist()], [ys[i] for i in selected.tolist()])
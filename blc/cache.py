@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+
+class HistogramCache:
+    """
+    Persistent cache of (idx_observed, total_investigated_genomic_positions) results.
+
+    Entries are keyed by the identity of the alignment file (path, size, mtime and the mtime of
+    its index), the region or BED file checksum and the settings that affect the result. Reading an
+    entry marks it as recently used; the least recently used entries are evicted once the total
+    size of the cache exceeds max_size (bytes). The reference sequences of blc.reference, in the
+    same directory, count against the same size.
+    """
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+    INDEX_SUFFIXES = ('.bai', '.csi', '.crai')
+
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @staticmethod
+    def default_cache_dir():
+        return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'bam-lorenz-coverage')
+
+    def key(self, bam_file, region=None, bed_regions=None, settings=None):
+        stat = os.stat(bam_file)
+
+        identity = {
+            'bam_file': os.path.realpath(bam_file),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'index_mtime': self._index_mtime(bam_file),
+            'region': region,
+            'bed_regions': self._checksum(bed_regions) if bed_regions else None,
+            'settings': settings,
+        }
+
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        filename = self._filename(key)
+
+        try:
+            with open(filename, 'r') as fh:
+                entry = json.load(fh)
+            os.utime(filename)
+        except (OSError, ValueError):
+            return None
+
+        return ({depth: frequency for depth, frequency in entry['idx_observed']}, entry['total_investigated_genomic_positions'])
+
+    def put(self, key, idx_observed, total_investigated_genomic_positions):
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        entry = {'idx_observed': sorted(idx_observed.items()), 'total_investigated_genomic_positions': total_investigated_genomic_positions}
+
+        # write and rename, so that concurrent runs never read a partially written entry
+        fd, tmp_filename = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(entry, fh)
+        os.replace(tmp_filename, self._filename(key))
+
+        self.evict()
+
+    def evict(self):
+        evict(self.cache_dir, self.max_size)
+
+    def _filename(self, key):
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def _index_mtime(self, bam_file):
+        base = os.path.splitext(bam_file)[0]
+        for index_file in [bam_file + suffix for suffix in self.INDEX_SUFFIXES] + [base + suffix for suffix in self.INDEX_SUFFIXES]:
+            if os.path.exists(index_file):
+                return os.stat(index_file).st_mtime_ns
+
+        return None
+
+    @staticmethod
+    def _checksum(filename):
+        checksum = hashlib.sha256()
+        with open(filename, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                checksum.update(chunk)
+
+        return checksum.hexdigest()
+
+
+def evict(cache_dir, max_size):
+    """
+    Removes the least recently used (modified) files of cache_dir and its subdirectories until
+    their total size is at most max_size (bytes). Files that are being written (.tmp) are kept.
+    """
+    entries = []
+    for directory, subdirectories, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            if not filename.endswith('.tmp'):
+                try:
+                    stat = os.stat(os.path.join(directory, filename))
+                    entries.append((stat.st_mtime_ns, stat.st_size, os.path.join(directory, filename)))
+                except OSError:
+                    pass
+
+    size = sum(entry[1] for entry in entries)
+    for mtime, entry_size, filename in sorted(entries):
+        if size <= max_size:
+            break
+
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+        size -= entry_size
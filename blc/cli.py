@@ -19,10 +19,18 @@ GNU General Public License for more details.
 """
 
 import click
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from blc import __version__
 from blc.blc import BamLorenzCoverage
+from blc.cache import HistogramCache
+from blc.reference import ReferenceCache
+from blc.metrics import Metrics
+from blc.binning import LogBinning
+from blc.histogram import save_histogram, load_histogram, merge_histograms, is_histogram_file
+from blc.coverage import COVERAGE_SUFFIXES, is_coverage_file
 
 _LICENSE = (
     "License GPLv3+: GNU GPL version 3 or later <http://gnu.org/licenses/gpl.html>.\n"
@@ -33,46 +41,442 @@ _LICENSE = (
     "https://github.com/yhoogstrate/bam-lorenz-coverage"
 )
 
+# SAM flag names as used by samtools
+_FLAGS = {'PAIRED': 0x1, 'PROPER_PAIR': 0x2, 'UNMAP': 0x4, 'MUNMAP': 0x8, 'REVERSE': 0x10, 'MREVERSE': 0x20, 'READ1': 0x40, 'READ2': 0x80,
+          'SECONDARY': 0x100, 'QCFAIL': 0x200, 'DUP': 0x400, 'SUPPLEMENTARY': 0x800}
+
+
+def parse_flags(ctx, param, value):
+    """
+    integer (decimal, 0x hexadecimal or 0 octal) or comma separated flag names, e.g. UNMAP,DUP
+    """
+    if value is None:
+        return None
+
+    try:
+        return int(value, 0)
+    except ValueError:
+        pass
+
+    flags = 0
+    for name in value.split(','):
+        if name.strip().upper() not in _FLAGS:
+            raise click.BadParameter(f"unknown flag: {name} (choose from: {', '.join(_FLAGS)})")
+        flags |= _FLAGS[name.strip().upper()]
+
+    return flags
+
+
+def parse_shard(ctx, param, value):
+    if value is None:
+        return None
+
+    try:
+        index, count = [int(x) for x in value.split('/')]
+    except ValueError:
+        raise click.BadParameter(f"expected i/N, got: {value}")
+
+    if not 1 <= index <= count:
+        raise click.BadParameter(f"expected 1 <= i <= N, got: {value}")
+
+    return (index, count)
+
 
 @click.command()
 @click.version_option(__version__ + "\n\n" + _LICENSE)
-@click.argument('input_alignment_file', type=click.Path(exists=True))
+@click.argument('input_alignment_files', nargs=-1, type=click.Path(exists=True, allow_dash=True), metavar='INPUT_ALIGNMENT_FILE...')
+@click.option('-H', '--export-histogram', help='Output depth histogram (.npz), can be used as input instead of the alignment file')
 @click.option('-l', '--lorenz-table', help='Output table Lorenz-curve (for stdout use: -)')
 @click.option('-c', '--coverage-table', help='Output table Coverage-graph (for stdout use: -)')
 @click.option('-L', '--lorenz-svg', help='Output figure Lorenz-curve (SVG).')
 @click.option('-C', '--coverage-svg', help='Output figure Coverage-graph (SVG).')
 @click.option('-s', '--stats', help='Output additional stats to text-file')
+@click.option('--max-points', type=click.IntRange(min=2), metavar='N', help='Reduce the curves in tables and figures to at most N points, picked along the curve; the ROC is computed at full resolution')
+@click.option('--metrics', 'metrics_file', metavar='FILE', help='Output wall and CPU time, throughput and peak memory per stage (JSON)')
+@click.option('--progress', is_flag=True, help='Report the percentage done, positions per second and ETA of every scan on stderr')
 @click.option('-r', '--region', help='Scan depth only in selected region <chr:from-to> (all positions: 1-based)')
 @click.option('-b', '--bed-regions', help='Scan depth only in selected positions or regions (BED file: start: 0-based & end: 1-based)')
-def CLI(lorenz_table, coverage_table, lorenz_svg, coverage_svg, input_alignment_file, stats, region, bed_regions):
-    b = BamLorenzCoverage()
-    idx_observed, n = b.bam_file_to_idx(input_alignment_file, region, bed_regions)
+@click.option('--per-region', type=click.Path(exists=True), metavar='BED', help='Histograms per named region (4th BED column) in a single pass, written with --region-stats')
+@click.option('--per-contig', is_flag=True, help='Histograms per contig in a single pass, written with --region-stats')
+@click.option('--region-stats', metavar='FILE', help='Per region mode: output table with per region ROC, sequenced bases and covered positions (for stdout use: -)')
+@click.option('--region-curves', metavar='DIR', help='Per region mode: output directory for per region Lorenz-curve and Coverage-graph tables')
+@click.option('--roc-track', metavar='FILE', help='Output the ROC per window as bedGraph track, to find regions with poor uniformity (for stdout use: -)')
+@click.option('--track-window-size', type=click.IntRange(min=1), default=100000, show_default=True, metavar='N', help='Window size of --roc-track')
+@click.option('-e', '--engine', type=click.Choice(BamLorenzCoverage.ENGINES), default='samtools', show_default=True, help='Depth engine: samtools depth text stream or native in-process sweep over the alignments')
+@click.option('-t', '--threads', type=click.IntRange(min=1), default=1, show_default=True, help='Number of worker processes; the genome is split in shards by contig and window')
+@click.option('--skip-zero-depth', is_flag=True, help='Let samtools depth only stream covered positions; the number of uncovered positions is derived from the contig, region or BED sizes')
+@click.option('-S', '--sample-sheet', type=click.Path(exists=True), help='Batch mode: tab separated file with per line a sample name and an alignment file')
+@click.option('-o', '--output-dir', help='Batch mode: output directory for per-sample tables, figures and stats, and the combined stats.tsv')
+@click.option('--cache-dir', default=HistogramCache.default_cache_dir(), show_default=True, help='Directory to cache depth histograms of scanned alignment files')
+@click.option('--cache-size', type=click.IntRange(min=0), default=HistogramCache.DEFAULT_MAX_SIZE // (1024 * 1024), show_default=True, help='Maximum size of the cache in MiB; least recently used entries are evicted')
+@click.option('--no-cache', is_flag=True, help='Do not read or write cached depth histograms')
+@click.option('--shard', callback=parse_shard, metavar='i/N', help='Only scan the i-th of N equal parts of the genome (1-based); combine the exported histograms (-H) with: bam-lorenz-coverage merge')
+@click.option('-Q', '--min-mapq', type=click.IntRange(min=0), default=0, show_default=True, help='Skip reads with a lower mapping quality')
+@click.option('-q', '--min-baseq', type=click.IntRange(min=0), default=0, show_default=True, help='Skip bases with a lower base quality')
+@click.option('--exclude-flags', callback=parse_flags, metavar='FLAGS', help='Skip reads with any of these flags (integer or names, e.g. UNMAP,SECONDARY)  [default: UNMAP,SECONDARY,QCFAIL,DUP]')
+@click.option('--include-flags', callback=parse_flags, metavar='FLAGS', help='Only use reads with any of these flags (integer or names)')
+@click.option('--exclude-duplicates', is_flag=True, help='Skip duplicate reads (DUP), also when --exclude-flags does not include it')
+@click.option('-R', '--reference', type=click.Path(exists=True), help='Reference genome (indexed FASTA) to decode CRAM files; its sequences are cached in <cache-dir>/ref')
+@click.option('--decompression-threads', type=click.IntRange(min=1), default=1, show_default=True, help='Number of htslib threads per opened alignment file, for BAM/CRAM decompression')
+@click.option('--exact-depth', type=click.IntRange(min=0), metavar='N', help='Count depths above N in log-spaced bins, which bounds the size of the histogram of ultra deep data; the stats include an upper bound of the error of the ROC')
+@click.option('--relative-error', type=click.FloatRange(min=0, max=1, min_open=True, max_open=True), default=LogBinning.DEFAULT_RELATIVE_ERROR, show_default=True, help='Maximum relative error of the depth of a log-spaced bin (--exact-depth)')
+@click.option('--approximate', type=click.FloatRange(min=0, max=1, min_open=True), metavar='RATE', help='Estimate the curves from a random sample of RATE of the genomic windows; the stats include the sampled fraction and a confidence interval of the ROC')
+@click.option('--sampling', type=click.Choice(['uniform', 'stratified']), default='uniform', show_default=True, help='Approximate mode: sample windows uniformly over the genome or with the same rate per contig')
+@click.option('--seed', type=int, default=0, show_default=True, help='Approximate mode: random seed')
+def CLI(lorenz_table, coverage_table, lorenz_svg, coverage_svg, input_alignment_files, export_histogram, stats, max_points, metrics_file, progress, region, bed_regions, per_region, per_contig, region_stats, region_curves, roc_track, track_window_size, engine, threads, skip_zero_depth, sample_sheet, output_dir, cache_dir, cache_size, no_cache, shard, min_mapq, min_baseq, exclude_flags, include_flags, exclude_duplicates, reference, decompression_threads, exact_depth, relative_error, approximate, sampling, seed):
+    """
+    Lorenz and coverage curves of alignment files. Partial histograms of
+    sharded runs (--shard) are combined with: bam-lorenz-coverage merge
+    """
+    cache = None if no_cache else HistogramCache(cache_dir, cache_size * 1024 * 1024)
+    reference_cache = None if no_cache else ReferenceCache(cache_dir, cache_size * 1024 * 1024)
+    if exclude_flags is None:
+        exclude_flags = BamLorenzCoverage.DEFAULT_EXCLUDE_FLAGS
+    if exclude_duplicates:
+        exclude_flags |= _FLAGS['DUP']
+
+    metrics = Metrics() if metrics_file else None
+
+    b = BamLorenzCoverage(engine, threads, skip_zero_depth, cache, shard, reference, decompression_threads, reference_cache,
+                          min_mapq, min_baseq, exclude_flags, include_flags or 0, metrics, progress,
+                          LogBinning(exact_depth, relative_error) if exact_depth is not None else None)
+
+    approximation = None
+    if approximate:
+        if shard:
+            raise click.UsageError("Option '--approximate' can not be combined with '--shard'.")
+        approximation = {'rate': approximate, 'stratified': sampling == 'stratified', 'seed': seed}
+
+    samples = get_samples(input_alignment_files, sample_sheet)
+    if not samples:
+        raise click.UsageError("Missing argument 'INPUT_ALIGNMENT_FILE...' or option '-S' / '--sample-sheet'.")
+
+    if roc_track:
+        conflicts = [option for option, value in [('--per-region', per_region), ('--per-contig', per_contig), ('--shard', shard), ('--approximate', approximate), ('-o', output_dir)] if value]
+        if conflicts:
+            raise click.UsageError(f"Option '--roc-track' can not be combined with: {', '.join(conflicts)}.")
+        if len(samples) > 1:
+            raise click.UsageError("Option '--roc-track' takes a single alignment file.")
+        if is_histogram_input(samples[0][1]) or is_coverage_input(samples[0][1]):
+            raise click.UsageError("Option '--roc-track' requires an alignment file, not a depth histogram or coverage file.")
+
+        try:
+            export_roc_track(b, samples[0][1], roc_track, track_window_size, region, bed_regions)
+        except ValueError as err:
+            raise click.UsageError(str(err))
+
+        # the track is a pass of its own
+        if not any([export_histogram, lorenz_table, coverage_table, lorenz_svg, coverage_svg, stats]):
+            return
+
+    if per_region or per_contig:
+        conflicts = [option for option, value in [('--per-contig', per_region and per_contig), ('-r', region), ('-b', bed_regions), ('--shard', shard), ('--approximate', approximate),
+                                                  ('-o', output_dir), ('-H', export_histogram), ('-l', lorenz_table), ('-c', coverage_table), ('-L', lorenz_svg), ('-C', coverage_svg), ('-s', stats)] if value]
+        if conflicts:
+            raise click.UsageError(f"Option '--per-region' / '--per-contig' can not be combined with: {', '.join(conflicts)}.")
+        if len(samples) > 1:
+            raise click.UsageError("Option '--per-region' / '--per-contig' takes a single alignment file.")
+        if is_histogram_input(samples[0][1]) or is_coverage_input(samples[0][1]):
+            raise click.UsageError(f"Option '{'--per-region' if per_region else '--per-contig'}' requires an alignment file, not a depth histogram or coverage file.")
+        if not region_stats and not region_curves:
+            raise click.UsageError("Option '--per-region' / '--per-contig' requires option '--region-stats' and/or '--region-curves'.")
+
+        try:
+            regions = b.bam_file_to_region_idx(samples[0][1], per_region)
+        except ValueError as err:
+            raise click.UsageError(str(err))
+
+        export_regions(b, regions, region_stats, region_curves, max_points)
+    elif output_dir is None:
+        if len(samples) > 1:
+            raise click.UsageError("Multiple alignment files require option '-o' / '--output-dir'.")
+
+        with worker_pool(threads) as pool:
+            idx_observed, n, report = next(get_histograms(b, [samples[0][1]], region, bed_regions, approximation, pool))
+
+            if export_histogram:
+                save_histogram(export_histogram, idx_observed, n, get_metadata(b, samples[0][1], region, bed_regions, report))
+
+            figures = []
+            export(b, idx_observed, n, lorenz_table, coverage_table, lorenz_svg, coverage_svg, stats, report, max_points, pool, figures)
+            wait_figures(b, figures)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+
+        with worker_pool(threads) as pool, open(os.path.join(output_dir, 'stats.tsv'), 'w') as fh:
+            figures = []
+            fh.write("sample\tROC_Lorenz_curve\ttotal_sequenced_bases\ttotal_covered_positions_of_genome\ttotal_investigated_genomic_positions\n")
+
+            results = get_histograms(b, [alignment_file for sample, alignment_file in samples], region, bed_regions, approximation, pool)
+            for (sample, alignment_file), (idx_observed, n, report) in zip(samples, results):
+                prefix = os.path.join(output_dir, sample)
+                if not is_histogram_input(alignment_file):
+                    save_histogram(prefix + '.histogram.npz', idx_observed, n, get_metadata(b, alignment_file, region, bed_regions, report))
+
+                lorenz_curves = export(b, idx_observed, n, prefix + '.lorenz.tsv', prefix + '.coverage.tsv', prefix + '.lorenz.svg', prefix + '.coverage.svg', prefix + '.stats.txt', report, max_points, pool, figures)
+
+                fh.write(f"{sample}\t{lorenz_curves['roc']}\t{lorenz_curves['total_sequenced_bases']}\t{lorenz_curves['total_covered_positions_of_genome']}\t{n}\n")
+
+            wait_figures(b, figures)
+
+    if metrics:
+        metrics.write(metrics_file)
+
+
+@click.command()
+@click.argument('partial_histograms', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('-H', '--export-histogram', help='Output merged depth histogram (.npz)')
+@click.option('-l', '--lorenz-table', help='Output table Lorenz-curve (for stdout use: -)')
+@click.option('-c', '--coverage-table', help='Output table Coverage-graph (for stdout use: -)')
+@click.option('-L', '--lorenz-svg', help='Output figure Lorenz-curve (SVG).')
+@click.option('-C', '--coverage-svg', help='Output figure Coverage-graph (SVG).')
+@click.option('-s', '--stats', help='Output additional stats to text-file')
+@click.option('--max-points', type=click.IntRange(min=2), metavar='N', help='Reduce the curves in tables and figures to at most N points, picked along the curve; the ROC is computed at full resolution')
+@click.option('--metrics', 'metrics_file', metavar='FILE', help='Output wall and CPU time, throughput and peak memory per stage (JSON)')
+def MERGE(partial_histograms, export_histogram, lorenz_table, coverage_table, lorenz_svg, coverage_svg, stats, max_points, metrics_file):
+    """
+    Merges the partial depth histograms of all shards (--shard i/N) of a
+    run, after checking that they are complete and disjoint.
+    """
+    try:
+        idx_observed, n, metadata = merge_histograms(partial_histograms)
+    except ValueError as err:
+        raise click.UsageError(str(err))
+
+    if export_histogram:
+        save_histogram(export_histogram, idx_observed, n, metadata)
+
+    metrics = Metrics() if metrics_file else None
+
+    binning = metadata['settings'].get('binning')
+
+    export(BamLorenzCoverage(metrics=metrics, binning=LogBinning(*binning) if binning else None), idx_observed, n, lorenz_table, coverage_table, lorenz_svg, coverage_svg, stats, max_points=max_points)
+
+    if metrics:
+        metrics.write(metrics_file)
+
+
+def export_roc_track(b, alignment_file, roc_track, window_size, region=None, bed_regions=None):
+    """
+    bedGraph track of the ROC per window, written while the alignment file is swept
+    """
+    if roc_track == '-':
+        write_roc_track(b, alignment_file, sys.stdout, window_size, region, bed_regions)
+    else:
+        with open(roc_track, 'w') as fh:
+            write_roc_track(b, alignment_file, fh, window_size, region, bed_regions)
+
+
+def write_roc_track(b, alignment_file, fh, window_size, region=None, bed_regions=None):
+    fh.write(f"track type=bedGraph name=ROC_Lorenz_curve description=\"ROC of the Lorenz curve per {window_size} bp\"\n")
+    for contig, start, end, roc in b.bam_file_to_window_rocs(alignment_file, window_size, region, bed_regions):
+        fh.write(f"{contig}\t{start}\t{end}\t{roc}\n")
+
+
+def export_regions(b, regions, region_stats=None, region_curves=None, max_points=None):
+    """
+    Per region stats table and (optionally) per region curve tables - the ROC of regions without
+    any sequenced base is NA
+    """
+    if region_curves:
+        os.makedirs(region_curves, exist_ok=True)
+
+    rows = []
+    for name, (idx_observed, n) in regions.items():
+        if not any(depth > 0 and frequency > 0 for depth, frequency in idx_observed.items()):
+            rows.append(f"{name}\tNA\t0\t0\t{n}\n")
+            continue
+
+        lorenz_curves = b.estimate_lorenz_curves(idx_observed)
+        rows.append(f"{name}\t{lorenz_curves['roc']}\t{lorenz_curves['total_sequenced_bases']}\t{lorenz_curves['total_covered_positions_of_genome']}\t{n}\n")
+
+        if region_curves:
+            prefix = os.path.join(region_curves, name.replace(os.sep, '_'))
+            with open(prefix + '.lorenz.tsv', 'w') as fh:
+                b.export_lorenz_curves(lorenz_curves, fh, max_points)
+            with open(prefix + '.coverage.tsv', 'w') as fh:
+                b.export_cumulative_coverage_curves(b.estimate_cumulative_coverage_curves(idx_observed), fh, max_points)
+
+    header = "region\tROC_Lorenz_curve\ttotal_sequenced_bases\ttotal_covered_positions_of_genome\ttotal_investigated_genomic_positions\n"
+    if region_stats == '-':
+        sys.stdout.writelines([header] + rows)
+    elif region_stats:
+        with open(region_stats, 'w') as fh:
+            fh.writelines([header] + rows)
+
+
+def get_samples(input_alignment_files, sample_sheet=None):
+    """
+    [(sample, alignment_file), ...] - samples are named after the file if not given in the sample sheet
+    """
+    samples = [(get_sample_name(alignment_file), alignment_file) for alignment_file in input_alignment_files]
+
+    if sample_sheet:
+        with open(sample_sheet, 'r') as fh:
+            for line in fh:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    columns = line.split('\t')
+                    if len(columns) == 1:
+                        samples.append((get_sample_name(columns[0]), columns[0]))
+                    else:
+                        samples.append((columns[0], columns[1]))
+
+    names = set()
+    for sample, alignment_file in samples:
+        if sample in names:
+            raise click.UsageError(f"Sample name is not unique: {sample}")
+        names.add(sample)
+
+    return samples
+
+
+def get_sample_name(filename):
+    filename = os.path.basename(filename)
+    if filename.endswith('.histogram.npz'):
+        return filename[:-len('.histogram.npz')]
+
+    # mosdepth: <prefix>.per-base.bed.gz
+    for suffix in sorted(('.per-base.bed.gz', ) + COVERAGE_SUFFIXES, key=len, reverse=True):
+        if filename.lower().endswith(suffix):
+            return filename[:-len(suffix)]
+
+    return filename.rsplit('.', 1)[0]
+
+
+def get_histograms(b, alignment_files, region=None, bed_regions=None, approximation=None, pool=None):
+    """
+    Yields (idx_observed, total_investigated_genomic_positions, report) per file, in order. Depth
+    histogram files (--export-histogram) are loaded, coverage files (bedGraph, mosdepth, bigWig)
+    are read, all other files are scanned in one go - or sampled, if approximation (arguments of
+    approximate_bam_file_to_idx) is given, in which case report describes the sample. Scans use
+    the given pool (worker_pool), if any.
+    """
+    histogram_files = set(filename for filename in alignment_files if is_histogram_input(filename))
+    if histogram_files and (region or bed_regions):
+        raise click.UsageError("Options '-r' / '--region' and '-b' / '--bed-regions' can not be applied to depth histogram files.")
+
+    coverage_files = set(filename for filename in alignment_files if is_coverage_input(filename))
+    if coverage_files and approximation is not None:
+        raise click.UsageError("Option '--approximate' can not be applied to coverage files.")
+    if coverage_files and b.shard:
+        raise click.UsageError("Option '--shard' can not be applied to coverage files.")
+
+    if approximation is None:
+        results = b.bam_files_to_idx([filename for filename in alignment_files if filename not in histogram_files | coverage_files], region, bed_regions, pool)
+
+    for filename in alignment_files:
+        if filename in histogram_files:
+            idx_observed, n, metadata = load_histogram(filename)
+            yield (idx_observed, n, metadata.get('approximation'))
+        elif filename in coverage_files:
+            try:
+                yield b.run_length_file_to_idx(filename, region, bed_regions) + (None, )
+            except ValueError as err:
+                raise click.UsageError(str(err))
+        else:
+            # e.g. unsorted or sharded streams
+            try:
+                if approximation is None:
+                    yield next(results) + (None, )
+                else:
+                    yield b.approximate_bam_file_to_idx(filename, region, bed_regions, **approximation, pool=pool)
+            except ValueError as err:
+                raise click.UsageError(str(err))
+
+
+def is_histogram_input(filename):
+    """
+    streams are never sniffed: they can only be read once
+    """
+    return not BamLorenzCoverage.is_stream(filename) and is_histogram_file(filename)
+
+
+def is_coverage_input(filename):
+    return not BamLorenzCoverage.is_stream(filename) and is_coverage_file(filename)
+
+
+def get_metadata(b, alignment_file, region=None, bed_regions=None, approximation=None):
+    if is_histogram_input(alignment_file):
+        # a re-exported histogram keeps the metadata of the scan it was made of
+        return load_histogram(alignment_file)[2]
+
+    metadata = {'source': os.path.abspath(alignment_file), 'region': region, 'bed_regions': bed_regions, 'settings': b.settings(),
+                'fingerprint': None if is_coverage_input(alignment_file) else b.fingerprint(alignment_file, region, bed_regions), 'version': __version__}
+
+    if approximation:
+        metadata['approximation'] = approximation
+
+    return metadata
+
+
+def worker_pool(threads):
+    """
+    One pool for the scans and the figures, so that at most threads worker processes run. Figures
+    are rendered in the background while the tables are written, in worker processes if multiple
+    threads are allowed.
+    """
+    return ProcessPoolExecutor(threads) if threads > 1 else ThreadPoolExecutor(1)
+
+
+def render_figure(b, exporter, *args, **kwargs):
+    """
+    Pool function: renders a figure with the given exporter method of b and returns the metrics it
+    recorded in a worker process (in this process they are recorded directly)
+    """
+    getattr(b, exporter)(*args, **kwargs)
+
+    return b.metrics.stages if b.metrics is not None and b.metrics.remote else []
+
+
+def wait_figures(b, figures):
+    """
+    Waits for the figures submitted by export and adds the metrics recorded in worker processes
+    """
+    for future in figures:
+        records = future.result()
+        if b.metrics is not None:
+            b.metrics.add(records)
+
+
+def export(b, idx_observed, n, lorenz_table=None, coverage_table=None, lorenz_svg=None, coverage_svg=None, stats=None, approximation=None, max_points=None, pool=None, figures=None):
+    """
+    Without a pool the figures are rendered right away, otherwise they are submitted to the pool
+    and their futures are added to figures
+    """
+    lorenz_curves = None
+
+    def render(exporter, *args, **kwargs):
+        if pool is None:
+            getattr(b, exporter)(*args, **kwargs)
+        else:
+            figures.append(pool.submit(render_figure, b, exporter, *args, **kwargs))
 
     if coverage_table or coverage_svg:
         cumulative_coverage_curves = b.estimate_cumulative_coverage_curves(idx_observed)
 
         if coverage_table:
             if coverage_table == '-':
-                b.export_cumulative_coverage_curves(cumulative_coverage_curves, sys.stdout)
+                b.export_cumulative_coverage_curves(cumulative_coverage_curves, sys.stdout, max_points)
             else:
                 with open(coverage_table, 'w') as fh:
-                    b.export_cumulative_coverage_curves(cumulative_coverage_curves, fh)
+                    b.export_cumulative_coverage_curves(cumulative_coverage_curves, fh, max_points)
 
         if coverage_svg:
-            b.export_cumulative_coverage_plot(cumulative_coverage_curves, coverage_svg)
+            render('export_cumulative_coverage_plot', cumulative_coverage_curves, coverage_svg, max_points=max_points)
 
     if lorenz_table or lorenz_svg or stats:
         lorenz_curves = b.estimate_lorenz_curves(idx_observed)
 
         if lorenz_table:
             if lorenz_table == '-':
-                b.export_lorenz_curves(lorenz_curves, sys.stdout)
+                b.export_lorenz_curves(lorenz_curves, sys.stdout, max_points)
             else:
                 with open(lorenz_table, 'w') as fh:
-                    b.export_lorenz_curves(lorenz_curves, fh)
+                    b.export_lorenz_curves(lorenz_curves, fh, max_points)
 
         if lorenz_svg:
-            b.export_lorenz_plot(lorenz_curves, lorenz_svg)
+            render('export_lorenz_plot', lorenz_curves, lorenz_svg, max_points=max_points)
 
         if stats:
             with open(stats, "w") as fh:
@@ -81,6 +485,20 @@ def CLI(lorenz_table, coverage_table, lorenz_svg, coverage_svg, input_alignment_
                 fh.write("total_sequenced_bases\t" + str(lorenz_curves["total_sequenced_bases"]) + "\n")
                 fh.write("total_covered_positions_of_genome\t" + str(lorenz_curves["total_covered_positions_of_genome"]) + "\n")
 
+                if b.binning:
+                    fh.write("ROC_Lorenz_curve_error_bound\t" + str(b.binning.roc_error_bound(idx_observed)) + "\n")
+
+                if approximation:
+                    fh.write("approximate_sampled_fraction\t" + str(approximation["sampled_fraction"]) + "\n")
+                    if approximation["roc_ci"]:
+                        fh.write("ROC_Lorenz_curve_CI" + str(round(100 * approximation["confidence"])) + "_low\t" + str(approximation["roc_ci"][0]) + "\n")
+                        fh.write("ROC_Lorenz_curve_CI" + str(round(100 * approximation["confidence"])) + "_high\t" + str(approximation["roc_ci"][1]) + "\n")
+
+    return lorenz_curves
+
 
 def main():
-    CLI()
+    if sys.argv[1:2] == ['merge']:
+        MERGE(args=sys.argv[2:], prog_name=os.path.basename(sys.argv[0]) + ' merge')
+    else:
+        CLI()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+
+Readers of run-length coverage files, as written by mosdepth (per-base.bed.gz),
+bedtools genomecov (-bg / -bga) and bedGraphToBigWig:
+
+  bedGraph      contig, start (0-based), end and depth per line, tab separated;
+                plain or gzip / bgzip compressed
+  bigWig        requires the optional pyBigWig package
+
+Runs are yielded as numpy arrays per chunk and contig: no Python object is
+created per line.
+"""
+
+import gzip
+import numpy as np
+
+from blc.lines import read_line_chunks, parse_integers
+
+
+BIGWIG_MAGIC = b'\x26\xfc\x8f\x88'
+COVERAGE_SUFFIXES = ('.bedgraph', '.bedgraph.gz', '.bdg', '.bdg.gz', '.bg', '.bg.gz', '.bed', '.bed.gz', '.bw', '.bigwig')
+READ_BUFFER_SIZE = 1024 * 1024
+BIGWIG_WINDOW_SIZE = 16 * 1024 * 1024
+
+
+def is_coverage_file(filename):
+    return filename.lower().endswith(COVERAGE_SUFFIXES)
+
+
+def is_bigwig_file(filename):
+    with open(filename, 'rb') as fh:
+        return fh.read(4) == BIGWIG_MAGIC
+
+
+def contig_lengths(filename):
+    """
+    {contig: length} of a bigWig file, None for bedGraph files (which have no header)
+    """
+    if not is_bigwig_file(filename):
+        return None
+
+    bw = _open_bigwig(filename)
+    try:
+        return dict(bw.chroms())
+    finally:
+        bw.close()
+
+
+def read_runs(filename, record=None):
+    """
+    Yields (contig, starts, ends, depths) - arrays (int64) of consecutive runs of a contig, in file
+    order. Depths are rounded to integers. The number of bytes read and lines parsed are added to
+    record (dict), if given.
+    """
+    if is_bigwig_file(filename):
+        yield from _read_bigwig_runs(filename, record)
+    else:
+        yield from _read_bedgraph_runs(filename, record)
+
+
+def _read_bedgraph_runs(filename, record=None, buffer_size=READ_BUFFER_SIZE):
+    """
+    Parsed chunk by chunk (blc.lines). bgzip files are gzip files of many members, which gzip
+    decompresses in one stream.
+    """
+    with open(filename, 'rb') as fh:
+        compressed = fh.read(2) == b'\x1f\x8b'
+
+    with (gzip.open(filename, 'rb') if compressed else open(filename, 'rb', buffering=0)) as fh:
+        for chunk, newlines in read_line_chunks(fh, buffer_size, record):
+            yield from _parse_bedgraph_lines(chunk, newlines)
+
+
+def _parse_bedgraph_lines(chunk, newlines):
+    """
+    [(contig, starts, ends, depths), ...] of the lines ending at the given newline positions;
+    empty, comment (#), track and browser lines are skipped
+    """
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    line_ends = newlines - (chunk[np.maximum(newlines - 1, 0)] == ord('\r'))
+
+    data = (line_ends > line_starts) & (chunk[np.minimum(line_starts, len(chunk) - 1)] != ord('#'))
+    for prefix in (b'track', b'browser'):
+        data &= ~_startswith(chunk, line_starts, line_ends, prefix)
+
+    line_starts = line_starts[data]
+    line_ends = line_ends[data]
+    if not len(line_starts):
+        return []
+
+    # the first three tabs of every line end the contig, start and end columns
+    tabs = np.flatnonzero(chunk == ord('\t'))
+    first = np.searchsorted(tabs, line_starts)
+    if np.any(first + 2 >= len(tabs)) or np.any(tabs[np.minimum(first + 2, len(tabs) - 1)] >= line_ends):
+        raise ValueError("Invalid bedGraph line: expected 4 tab separated columns (contig, start, end, depth)")
+
+    contig_ends = tabs[first]
+    start_ends = tabs[first + 1]
+    end_ends = tabs[first + 2]
+    next_tabs = tabs[np.minimum(first + 3, len(tabs) - 1)]
+    depth_ends = np.where((first + 3 < len(tabs)) & (next_tabs < line_ends), next_tabs, line_ends)
+
+    starts = parse_integers(chunk, contig_ends + 1, start_ends)
+    ends = parse_integers(chunk, start_ends + 1, end_ends)
+    depths = parse_integers(chunk, end_ends + 1, depth_ends)
+    if starts is None or ends is None:
+        raise ValueError("Invalid bedGraph line: start and end must be non-negative integers")
+    if depths is None:
+        depths = _parse_decimals(chunk, end_ends + 1, depth_ends)
+
+    runs = []
+    boundaries = np.append(np.flatnonzero(~_same_as_previous(chunk, line_starts, contig_ends)), len(line_starts))
+    for i, j in zip(boundaries[:-1].tolist(), boundaries[1:].tolist()):
+        contig = bytes(chunk[line_starts[i]:contig_ends[i]]).decode('utf-8')
+        runs.append((contig, starts[i:j], ends[i:j], depths[i:j]))
+
+    return runs
+
+
+def _startswith(chunk, line_starts, line_ends, prefix):
+    matches = line_ends - line_starts >= len(prefix)
+    for k, byte in enumerate(prefix):
+        matches &= chunk[np.minimum(line_starts + k, len(chunk) - 1)] == byte
+
+    return matches
+
+
+def _same_as_previous(chunk, field_starts, field_ends):
+    """
+    per field: whether it is identical to the field of the previous line (False for the first)
+    """
+    lengths = field_ends - field_starts
+
+    same = np.zeros(len(field_starts), dtype=bool)
+    same[1:] = lengths[1:] == lengths[:-1]
+    for k in range(int(lengths.max(initial=0))):
+        compared = same[1:] & (lengths[1:] > k)
+        same[1:][compared] = chunk[field_starts[1:][compared] + k] == chunk[field_starts[:-1][compared] + k]
+
+    return same
+
+
+def _parse_decimals(chunk, field_starts, field_ends):
+    """
+    Decimal (e.g. normalized or averaged) depths, rounded to integers
+    """
+    fields = np.array([bytes(chunk[start:end]) for start, end in zip(field_starts.tolist(), field_ends.tolist())])
+    try:
+        depths = np.rint(fields.astype(np.float64))
+    except ValueError:
+        raise ValueError("Invalid bedGraph line: depth is not a number")
+
+    if np.any(depths < 0) or not np.all(np.isfinite(depths)):
+        raise ValueError("Invalid bedGraph line: depth must be a non-negative number")
+
+    return depths.astype(np.int64)
+
+
+def _open_bigwig(filename):
+    try:
+        import pyBigWig
+    except ImportError:
+        raise ValueError(f"Reading bigWig files requires the pyBigWig package (pip install pyBigWig): {filename}")
+
+    bw = pyBigWig.open(filename)
+    if bw is None or not bw.isBigWig():
+        raise ValueError(f"Not a bigWig file: {filename}")
+
+    return bw
+
+
+def _read_bigwig_runs(filename, record=None):
+    """
+    The intervals of every contig are fetched in windows of BIGWIG_WINDOW_SIZE and clipped to them,
+    so that the memory use does not depend on the contig length
+    """
+    intervals_read = 0
+
+    bw = _open_bigwig(filename)
+    try:
+        for contig, length in bw.chroms().items():
+            for window_start in range(0, length, BIGWIG_WINDOW_SIZE):
+                window_end = min(window_start + BIGWIG_WINDOW_SIZE, length)
+
+                intervals = bw.intervals(contig, window_start, window_end)
+                if not intervals:
+                    continue
+
+                intervals = np.array(intervals, dtype=np.float64)
+                depths = np.rint(intervals[:, 2])
+                if np.any(depths < 0) or not np.all(np.isfinite(depths)):
+                    raise ValueError(f"Invalid bigWig file, depth must be a non-negative number: {filename}")
+
+                intervals_read += len(intervals)
+                yield (contig,
+                       np.maximum(intervals[:, 0].astype(np.int64), window_start),
+                       np.minimum(intervals[:, 1].astype(np.int64), window_end),
+                       depths.astype(np.int64))
+    finally:
+        bw.close()
+
+    if record is not None:
+        record['intervals_read'] = intervals_read
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+
+DepthHistogram: compact, array backed depth histogram.
+
+Depth histogram file format: a (compressed) numpy .npz archive with
+
+  format        'bam-lorenz-coverage-histogram'
+  version       format version (int)
+  depth         depths with a non-zero frequency (int64, ascending)
+  frequency     number of genomic positions per depth (int64)
+  total         total_investigated_genomic_positions (int64)
+  metadata      JSON encoded dict (e.g. source file, region, settings)
+"""
+
+import json
+import zipfile
+import numpy as np
+from collections import defaultdict
+from collections.abc import Mapping
+
+
+FORMAT = 'bam-lorenz-coverage-histogram'
+VERSION = 1
+
+
+class DepthHistogram(Mapping):
+    """
+    Read-only {depth: frequency} mapping backed by two arrays (depths, ascending, and their
+    frequencies; 16 bytes per distinct depth), that can be used wherever idx_observed is used: by
+    the estimators of BamLorenzCoverage, save_histogram and the cache. Histograms of disjoint
+    positions are merged with +.
+
+    Depths without positions are not stored. The total number of investigated positions is the
+    sum of all frequencies, including the ones of depth 0.
+    """
+
+    def __init__(self, depths, frequencies):
+        self.depths = np.asarray(depths, dtype=np.int64)
+        self.frequencies = np.asarray(frequencies, dtype=np.int64)
+
+        if self.depths.shape != self.frequencies.shape or self.depths.ndim != 1:
+            raise ValueError("Depths and frequencies must be one dimensional arrays of the same length")
+
+        if np.any(np.diff(self.depths) <= 0):
+            raise ValueError("Depths must be unique and in ascending order")
+
+    @classmethod
+    def from_counts(cls, counts, binning=None):
+        """
+        From a dense array of frequencies indexed by depth - or by bin, if binning
+        (blc.binning.LogBinning) is given
+        """
+        counts = np.asarray(counts)
+        indices = np.flatnonzero(counts)
+
+        return cls(binning.depths(len(counts))[indices] if binning else indices, counts[indices])
+
+    @classmethod
+    def from_depth(cls, depth, binning=None):
+        """
+        From a per-base depth array (e.g. of another tool), counted with np.bincount
+        """
+        depth = np.asarray(depth)
+        if depth.dtype.kind not in 'iu':
+            raise ValueError(f"Depth array must be of an integer type, not {depth.dtype}")
+
+        if len(depth) and depth.min() < 0:
+            raise ValueError("Depth array contains negative depths")
+
+        return cls.from_counts(np.bincount(binning.index(depth) if binning else depth), binning)
+
+    @classmethod
+    def from_dict(cls, idx_observed):
+        depths = sorted(depth for depth, frequency in idx_observed.items() if frequency)
+
+        return cls(depths, [idx_observed[depth] for depth in depths])
+
+    @property
+    def total(self):
+        """
+        total_investigated_genomic_positions
+        """
+        return int(self.frequencies.sum())
+
+    def to_dict(self):
+        return dict(zip(self.depths.tolist(), self.frequencies.tolist()))
+
+    def __getitem__(self, depth):
+        i = int(np.searchsorted(self.depths, depth))
+        if i == len(self.depths) or self.depths[i] != depth:
+            raise KeyError(depth)
+
+        return int(self.frequencies[i])
+
+    def __iter__(self):
+        return iter(self.depths.tolist())
+
+    def __len__(self):
+        return len(self.depths)
+
+    def __add__(self, other):
+        if not isinstance(other, DepthHistogram):
+            other = DepthHistogram.from_dict(other)
+
+        depths = np.union1d(self.depths, other.depths)
+        frequencies = np.zeros(len(depths), dtype=np.int64)
+        frequencies[np.searchsorted(depths, self.depths)] += self.frequencies
+        frequencies[np.searchsorted(depths, other.depths)] += other.frequencies
+
+        return DepthHistogram(depths, frequencies)
+
+    def __repr__(self):
+        return f"DepthHistogram({self.to_dict()})"
+
+
+def save_histogram(filename, idx_observed, total_investigated_genomic_positions, metadata=None):
+    depths = sorted(idx_observed)
+
+    # a file handle prevents numpy from appending '.npz' to the filename
+    with open(filename, 'wb') as fh:
+        np.savez_compressed(fh,
+                            format=np.array(FORMAT),
+                            version=np.array(VERSION, dtype=np.int64),
+                            depth=np.array(depths, dtype=np.int64),
+                            frequency=np.array([idx_observed[depth] for depth in depths], dtype=np.int64),
+                            total=np.array(total_investigated_genomic_positions, dtype=np.int64),
+                            metadata=np.array(json.dumps(metadata or {})))
+
+
+def load_histogram(filename):
+    """
+    -> (idx_observed, total_investigated_genomic_positions, metadata)
+    """
+    with np.load(filename, allow_pickle=False) as data:
+        if 'format' not in data.files or str(data['format']) != FORMAT:
+            raise ValueError(f"Not a depth histogram file: {filename}")
+
+        if int(data['version']) > VERSION:
+            raise ValueError(f"Depth histogram file {filename} has version {int(data['version'])}, only versions up to {VERSION} are supported")
+
+        idx_observed = {int(depth): int(frequency) for depth, frequency in zip(data['depth'], data['frequency'])}
+
+        return (idx_observed, int(data['total']), json.loads(str(data['metadata'])))
+
+
+def merge_histograms(filenames):
+    """
+    Sums the partial histograms of a sharded run (--shard i/N), after checking that they belong to
+    the same run (same investigated positions and settings) and cover all N shards exactly once.
+
+    -> (idx_observed, total_investigated_genomic_positions, metadata)
+    """
+    idx_observed = defaultdict(int)
+    total_investigated_genomic_positions = 0
+
+    run = None
+    shards = {}
+    for filename in filenames:
+        partial_idx_observed, n, metadata = load_histogram(filename)
+
+        settings = dict(metadata.get('settings') or {})
+        shard = settings.pop('shard', None)
+        if not shard:
+            raise ValueError(f"Not a partial depth histogram of a sharded run: {filename}")
+
+        index, count = shard
+        if run is None:
+            run = (metadata.get('fingerprint'), count, settings, metadata)
+        elif (metadata.get('fingerprint'), count, settings) != run[0:3]:
+            raise ValueError(f"Partial depth histogram does not belong to the same run as the others: {filename}")
+
+        if index in shards:
+            raise ValueError(f"Shard {index}/{count} is given more than once: {shards[index]}, {filename}")
+        shards[index] = filename
+
+        for depth, frequency in partial_idx_observed.items():
+            idx_observed[depth] += frequency
+        total_investigated_genomic_positions += n
+
+    if run is None:
+        raise ValueError("No partial depth histograms given")
+
+    missing = [str(index) for index in range(1, run[1] + 1) if index not in shards]
+    if missing:
+        raise ValueError(f"Incomplete run, missing shard(s): {', '.join(missing)} (of {run[1]})")
+
+    metadata = dict(run[3])
+    metadata['settings'] = dict(run[2], shard=None)
+    metadata['merged_shards'] = run[1]
+
+    return (dict(idx_observed), total_investigated_genomic_positions, metadata)
+
+
+def is_histogram_file(filename):
+    try:
+        with zipfile.ZipFile(filename) as archive:
+            return 'format.npy' in archive.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return False
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+
+Chunked reading and parsing of line based text (samtools depth output,
+bedGraph files) with numpy: all lines of a chunk are parsed at once, no
+Python object is created per line.
+"""
+
+import numpy as np
+
+
+READ_BUFFER_SIZE = 256 * 1024
+
+
+def read_line_chunks(fh, buffer_size=READ_BUFFER_SIZE, record=None):
+    """
+    Yields (chunk, newlines) per chunk of complete lines of a binary file object: the chunk as
+    uint8 array and the positions of its newlines. A last line without trailing newline is yielded
+    with one appended.
+
+    Chunks are read into one reusable buffer, an incomplete last line is moved to the front of the
+    buffer for the next chunk. A chunk is only valid until the next one is read.
+
+    The number of bytes read and lines parsed are added to record (dict), if given.
+    """
+    buffer = bytearray(buffer_size)
+    filled = 0
+    bytes_read = 0
+    lines_parsed = 0
+
+    while True:
+        with memoryview(buffer) as view:
+            n = fh.readinto(view[filled:])
+
+        if not n:
+            break
+
+        filled += n
+        bytes_read += n
+        chunk = np.frombuffer(buffer, dtype=np.uint8, count=filled)
+        newlines = np.flatnonzero(chunk == ord('\n'))
+
+        if len(newlines) > 0:
+            yield chunk, newlines
+            lines_parsed += len(newlines)
+
+            parsed = int(newlines[-1]) + 1
+            buffer[:filled - parsed] = buffer[parsed:filled]
+            filled -= parsed
+        elif filled == len(buffer):
+            # line longer than the buffer; a new buffer, as the last chunk may still refer to this one
+            buffer = buffer + bytearray(len(buffer))
+        del chunk
+
+    if filled > 0:
+        yield np.frombuffer(bytes(buffer[:filled]) + b'\n', dtype=np.uint8), np.array([filled])
+        lines_parsed += 1
+
+    if record is not None:
+        record['bytes_read'] = bytes_read
+        record['lines_parsed'] = lines_parsed
+
+
+def parse_integers(chunk, field_starts, field_ends):
+    """
+    Integer values of the given fields, with digits accumulated from right to left, one numpy
+    operation per digit - or None if any field is not a non-negative integer
+    """
+    lengths = field_ends - field_starts
+    if np.any(lengths <= 0):
+        return None
+
+    values = np.zeros(len(lengths), dtype=np.int64)
+    for i in range(int(lengths.max(initial=0))):
+        digits = chunk[np.maximum(field_ends - 1 - i, 0)].astype(np.int64) - ord('0')
+        digits[lengths <= i] = 0
+
+        if np.any((digits < 0) | (digits > 9)):
+            return None
+
+        values += digits * (10 ** i)
+
+    return values
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Wall and CPU time, counters (e.g. positions, bytes read) and peak memory of the stages of a
+    run, in the order in which they finish.
+
+    Every callback is called with the record (dict) of each finished stage, so that library
+    callers can log or monitor a run while it progresses:
+
+        b = BamLorenzCoverage(metrics=Metrics([print]))
+
+    Stages of worker processes are recorded in the copy of the worker; they are not merged unless
+    their records are returned and added explicitly.
+    """
+
+    def __init__(self, callbacks=None):
+        self.callbacks = list(callbacks) if callbacks else []
+        self.stages = []
+        self.origin = time.perf_counter()
+        self.remote = False
+
+    def __getstate__(self):
+        # callbacks may not be picklable, and workers need not get the stages recorded so far
+        return {'callbacks': [], 'stages': [], 'origin': self.origin, 'remote': True}
+
+    @contextmanager
+    def stage(self, name, **counters):
+        """
+        Records the stage run within the with-block; counters can be added to the yielded record.
+        Throughput (positions_per_second) is derived from a 'positions' counter.
+        """
+        record = {'stage': name}
+        record.update(counters)
+
+        times = os.times()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - start
+            finished = os.times()
+
+            record['start_seconds'] = start - self.origin
+            record['wall_seconds'] = wall
+            record['cpu_seconds'] = (finished.user - times.user) + (finished.system - times.system)
+            record['children_cpu_seconds'] = (finished.children_user - times.children_user) + (finished.children_system - times.children_system)
+            if 'positions' in record and wall > 0:
+                record['positions_per_second'] = record['positions'] / wall
+            record['peak_rss_bytes'] = self.peak_rss()[0]
+
+            self.add([record])
+
+    def add(self, records):
+        for record in records:
+            self.stages.append(record)
+            for callback in self.callbacks:
+                callback(record)
+
+    @staticmethod
+    def peak_rss():
+        """
+        (peak resident set size of this process, of its largest finished child process) in bytes
+        """
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+    def to_dict(self):
+        times = os.times()
+        peak_rss, peak_rss_children = self.peak_rss()
+
+        return {'wall_seconds': time.perf_counter() - self.origin,
+                'cpu_seconds': times.user + times.system,
+                'children_cpu_seconds': times.children_user + times.children_system,
+                'peak_rss_bytes': peak_rss,
+                'peak_rss_children_bytes': peak_rss_children,
+                'stages': self.stages}
+
+    def write(self, filename):
+        with open(filename, 'w') as fh:
+            json.dump(self.to_dict(), fh, indent=2)
+            fh.write("\n")
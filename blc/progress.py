@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+import sys
+import time
+
+
+class Progress:
+    """
+    Percentage done, positions per second and estimated time remaining of a scan of a known number
+    of positions (the size of the contigs, region or BED regions), written to stderr.
+
+    update() is called once per chunk, window or shard rather than per position, and only writes a
+    line once every interval seconds: on a terminal the line is overwritten in place, in log files
+    every update gets its own line and they are written less often.
+    """
+    TERMINAL_INTERVAL = 1.0
+    LOG_INTERVAL = 60.0
+
+    def __init__(self, label, total, stream=None, interval=None):
+        self.label = label
+        self.total = total
+        self.stream = stream if stream is not None else sys.stderr
+        self.terminal = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.interval = interval if interval is not None else (self.TERMINAL_INTERVAL if self.terminal else self.LOG_INTERVAL)
+
+        self.done = 0
+        self.started = time.perf_counter()
+        self.reported = self.started
+
+    def update(self, positions):
+        self.done += positions
+
+        now = time.perf_counter()
+        if now - self.reported >= self.interval and self.done < self.total:
+            self.reported = now
+            self._write(now)
+
+    def finish(self):
+        self.done = max(self.done, self.total)
+        self._write(time.perf_counter(), True)
+
+    def line(self, now):
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        fraction = min(1.0, 1.0 * self.done / self.total) if self.total else 1.0
+
+        if fraction >= 1.0:
+            remaining = f"done in {self._duration(elapsed)}"
+        elif rate > 0:
+            remaining = f"ETA {self._duration((self.total - self.done) / rate)}"
+        else:
+            remaining = "ETA unknown"
+
+        return f"{self.label}: {100.0 * fraction:5.1f}% of {self.total} positions, {rate:.0f} positions/s, {remaining}"
+
+    def _write(self, now, final=False):
+        if self.terminal:
+            self.stream.write('\r' + self.line(now) + ('\n' if final else ''))
+        else:
+            self.stream.write(self.line(now) + '\n')
+        self.stream.flush()
+
+    @staticmethod
+    def _duration(seconds):
+        seconds = int(round(seconds))
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
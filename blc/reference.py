@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+from blc.cache import HistogramCache, evict
+
+
+class ReferenceCache:
+    """
+    Local cache of reference sequences for decoding CRAM files, in <cache_dir>/ref in the layout of
+    the htslib REF_CACHE: one file per sequence, named after the MD5 checksum of the upper case
+    sequence (the M5 tag in the CRAM header) as <md5[0:2]>/<md5[2:4]>/<md5[4:]>.
+
+    htslib memory maps these files, so all worker processes, regions and shards share one copy of
+    each sequence instead of every file handle loading it from the FASTA file. The sequences share
+    the least recently used eviction and max_size (bytes) of the depth histograms in cache_dir
+    (blc.cache.HistogramCache); a reference that is larger than max_size is not cached.
+    """
+    BLOCK_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, cache_dir, max_size=HistogramCache.DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def pattern(self):
+        """
+        REF_PATH / REF_CACHE pattern of the cache
+        """
+        return os.path.join(self.cache_dir, 'ref', '%2s', '%2s', '%s')
+
+    def populate(self, fasta_file):
+        """
+        Adds all sequences of the (indexed) FASTA file, read block by block, and marks them as
+        recently used. A FASTA file is only read again if any of its sequences was evicted: a stamp
+        of its path, size and modification time and the checksums of its sequences is kept in the
+        cache.
+
+        -> set of MD5 checksums of the sequences, None if the sequences do not fit in the cache
+        """
+        stat = os.stat(fasta_file)
+        identity = {'fasta_file': os.path.realpath(fasta_file), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        stamp = os.path.join(self.cache_dir, 'ref', hashlib.sha256(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest() + '.fasta')
+
+        try:
+            with open(stamp, 'r') as fh:
+                md5s = json.load(fh)['md5']
+
+            for md5 in md5s + [None]:
+                os.utime(stamp if md5 is None else self._filename(md5))
+
+            return set(md5s)
+        except (OSError, ValueError, KeyError):
+            pass
+
+        import pysam
+        with pysam.FastaFile(fasta_file) as fasta:
+            if sum(fasta.lengths) > self.max_size:
+                return None
+
+            md5s = [self._add(fasta, contig, length) for contig, length in zip(fasta.references, fasta.lengths)]
+
+        self._write(stamp, json.dumps(dict(identity, md5=md5s)).encode('utf-8'))
+        evict(self.cache_dir, self.max_size)
+
+        # the stamp itself may not have fitted besides the sequences
+        if not all(os.path.exists(self._filename(md5)) for md5 in md5s):
+            return None
+
+        return set(md5s)
+
+    @contextmanager
+    def environment(self):
+        """
+        Context in which htslib looks up reference sequences in this cache first (REF_PATH) and
+        stores the ones it fetches elsewhere in it (REF_CACHE). Processes started within the
+        context inherit it; the previous environment is restored afterwards.
+        """
+        previous = {name: os.environ.get(name) for name in ('REF_PATH', 'REF_CACHE')}
+
+        ref_path = previous['REF_PATH']
+        if not ref_path or not ref_path.startswith(self.pattern()):
+            os.environ['REF_PATH'] = self.pattern() + (':' + ref_path if ref_path else '')
+        os.environ['REF_CACHE'] = self.pattern()
+        try:
+            yield
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    def _add(self, fasta, contig, length):
+        """
+        Writes the sequence of a contig, without holding more than BLOCK_SIZE of it in memory
+        -> its MD5 checksum
+        """
+        checksum = hashlib.md5()
+
+        # the checksum, and so the filename, is only known once the sequence is written
+        os.makedirs(os.path.join(self.cache_dir, 'ref'), exist_ok=True)
+        fd, tmp_filename = tempfile.mkstemp(dir=os.path.join(self.cache_dir, 'ref'), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                for start in range(0, length, self.BLOCK_SIZE):
+                    block = fasta.fetch(contig, start, min(start + self.BLOCK_SIZE, length)).upper().encode('ascii')
+                    checksum.update(block)
+                    fh.write(block)
+
+            filename = self._filename(checksum.hexdigest())
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            os.replace(tmp_filename, filename)
+        finally:
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
+
+        return checksum.hexdigest()
+
+    def _filename(self, md5):
+        return os.path.join(self.cache_dir, 'ref', md5[0:2], md5[2:4], md5[4:])
+
+    @staticmethod
+    def _write(filename, data):
+        # write and rename, so that concurrent runs never read a partially written file
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_filename, filename)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+
+Reproducible benchmark of bam-lorenz-coverage on a synthetic, coordinate
+sorted BAM file. Times the depth histogram (bam_file_to_idx), the curve
+estimators and the exporters per engine and number of threads, and writes
+the throughput (investigated positions per second) and peak memory as JSON:
+
+  $ python scripts/benchmark.py --genome-size 10000000 --depth 30 \\
+        --threads 1 4 -o benchmark.json
+
+The data set only depends on its parameters and --seed, so results of
+different releases can be compared. Use --bam to benchmark an existing file.
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+import pysam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from blc import __version__  # noqa: E402
+from blc.blc import BamLorenzCoverage  # noqa: E402
+
+
+def write_synthetic_bam(bam_file, genome_size, depth, read_length=150, contigs=1, unevenness=0.5, bin_size=1000, seed=1, reference=None, cram_file=None):
+    """
+    Coordinate sorted and indexed BAM file with depth * genome_size / read_length reads. The
+    expected depth of every bin of bin_size positions is drawn from a gamma distribution with mean
+    depth and coefficient of variation unevenness (0 = uniform coverage), reads are placed
+    uniformly within their bin.
+
+    With reference, a random genome is written to that (indexed) FASTA file and the reads carry
+    its sequence, otherwise all reads have the same sequence. With cram_file, the reads are also
+    written as (indexed) CRAM file, which requires reference.
+    """
+    rng = np.random.default_rng(seed)
+
+    contig_length = genome_size // contigs
+    header = {'HD': {'VN': '1.6', 'SO': 'coordinate'}, 'SQ': [{'SN': f'chr{i + 1}', 'LN': contig_length} for i in range(contigs)]}
+
+    n_bins = max(1, (contig_length - read_length) // bin_size)
+    reads_per_contig = int(depth * contig_length / read_length)
+    sequence = 'ACGT' * (read_length // 4) + 'ACGT'[:read_length % 4]
+    qualities = pysam.qualitystring_to_array('I' * read_length)
+
+    if reference:
+        # a generator of its own, so that the reads do not depend on whether a reference is written
+        genome = np.frombuffer(b'ACGT', dtype=np.uint8)[np.random.default_rng([seed, 1]).integers(0, 4, (contigs, contig_length))]
+        with open(reference, 'w') as fh:
+            for tid in range(contigs):
+                fh.write(f">chr{tid + 1}\n")
+                for i in range(0, contig_length, 60):
+                    fh.write(genome[tid, i:i + 60].tobytes().decode() + "\n")
+        pysam.faidx(reference)
+
+    with pysam.AlignmentFile(bam_file, 'wb', header=header) as fh:
+        for tid in range(contigs):
+            if unevenness > 0:
+                weights = rng.gamma(1.0 / unevenness ** 2, unevenness ** 2, n_bins)
+            else:
+                weights = np.ones(n_bins)
+
+            per_bin = rng.multinomial(reads_per_contig, weights / weights.sum())
+            positions = np.repeat(np.arange(n_bins) * bin_size, per_bin) + rng.integers(0, bin_size, per_bin.sum())
+            positions = np.sort(np.minimum(positions, contig_length - read_length))
+
+            for i, position in enumerate(positions.tolist()):
+                read = pysam.AlignedSegment(fh.header)
+                read.query_name = f"read_{tid}_{i}"
+                read.reference_id = tid
+                read.reference_start = position
+                read.mapping_quality = 60
+                read.cigarstring = f"{read_length}M"
+                read.query_sequence = genome[tid, position:position + read_length].tobytes().decode() if reference else sequence
+                read.query_qualities = qualities
+                fh.write(read)
+
+    pysam.index(bam_file)
+
+    if cram_file:
+        if not reference:
+            raise ValueError("A CRAM file requires a reference")
+
+        pysam.view('-C', '-T', reference, '-o', cram_file, bam_file, catch_stdout=False)
+        pysam.index(cram_file)
+
+
+def peak_rss():
+    """
+    peak resident set size in bytes of this process and of its largest (waited for) child process
+    """
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def run_case(bam_file, engine, threads, tmp_dir, queue):
+    """
+    Runs in a fresh process, so that its peak memory only belongs to this case
+    """
+    b = BamLorenzCoverage(engine, threads)
+    seconds = {}
+
+    start = time.perf_counter()
+    idx_observed, n = b.bam_file_to_idx(bam_file)
+    seconds['bam_file_to_idx'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lorenz_curves = b.estimate_lorenz_curves(idx_observed)
+    seconds['estimate_lorenz_curves'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cumulative_coverage_curves = b.estimate_cumulative_coverage_curves(idx_observed)
+    seconds['estimate_cumulative_coverage_curves'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    b.export_lorenz_curves(lorenz_curves, io.StringIO())
+    b.export_cumulative_coverage_curves(cumulative_coverage_curves, io.StringIO())
+    seconds['export_tables'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    b.export_lorenz_plot(lorenz_curves, os.path.join(tmp_dir, f'{engine}.{threads}.lorenz.svg'))
+    b.export_cumulative_coverage_plot(cumulative_coverage_curves, os.path.join(tmp_dir, f'{engine}.{threads}.coverage.svg'))
+    seconds['export_plots'] = time.perf_counter() - start
+
+    rss_self, rss_children = peak_rss()
+    queue.put({'engine': engine,
+               'threads': threads,
+               'positions': n,
+               'distinct_depths': len(idx_observed),
+               'roc': lorenz_curves['roc'],
+               'seconds': seconds,
+               'positions_per_second': n / seconds['bam_file_to_idx'],
+               'peak_rss_bytes': rss_self,
+               'peak_rss_children_bytes': rss_children})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Throughput and memory benchmark of bam-lorenz-coverage')
+    parser.add_argument('--genome-size', type=int, default=5000000, help='total length of the contigs')
+    parser.add_argument('--contigs', type=int, default=1, help='number of contigs')
+    parser.add_argument('--depth', type=float, default=30.0, help='mean sequencing depth')
+    parser.add_argument('--read-length', type=int, default=150)
+    parser.add_argument('--unevenness', type=float, default=0.5, help='coefficient of variation of the depth per bin (0 = uniform)')
+    parser.add_argument('--bin-size', type=int, default=1000, help='resolution of the unevenness')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--bam', help='benchmark this alignment file instead of a synthetic one')
+    parser.add_argument('--engines', nargs='+', choices=BamLorenzCoverage.ENGINES, default=list(BamLorenzCoverage.ENGINES))
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('-o', '--output', help='JSON output file (default: stdout)')
+    args = parser.parse_args()
+
+    # a fresh interpreter per case: peak memory is not inherited from earlier cases
+    context = multiprocessing.get_context('spawn')
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.bam:
+            bam_file = args.bam
+            data_set = {'bam': os.path.abspath(bam_file)}
+        else:
+            bam_file = os.path.join(tmp_dir, 'synthetic.bam')
+            data_set = {'genome_size': args.genome_size, 'contigs': args.contigs, 'depth': args.depth, 'read_length': args.read_length,
+                        'unevenness': args.unevenness, 'bin_size': args.bin_size, 'seed': args.seed}
+
+            start = time.perf_counter()
+            write_synthetic_bam(bam_file, args.genome_size, args.depth, args.read_length, args.contigs, args.unevenness, args.bin_size, args.seed)
+            data_set['generation_seconds'] = time.perf_counter() - start
+        data_set['size_bytes'] = os.path.getsize(bam_file)
+
+        results = []
+        for engine in args.engines:
+            for threads in args.threads:
+                queue = context.Queue()
+                process = context.Process(target=run_case, args=(bam_file, engine, threads, tmp_dir, queue))
+                process.start()
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError(f"benchmark of engine {engine} with {threads} threads failed")
+
+                result = queue.get()
+                results.append(result)
+
+                print(f"{engine}\t{threads}\t{result['positions_per_second']:.0f} positions/s\t{result['peak_rss_bytes'] / 2 ** 20:.0f} MiB", file=sys.stderr)
+
+    report = {'version': __version__,
+              'python': platform.python_version(),
+              'pysam': pysam.__version__,
+              'numpy': np.__version__,
+              'platform': platform.platform(),
+              'cpu_count': os.cpu_count(),
+              'data_set': data_set,
+              'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(report, fh, indent=2)
+            fh.write("\n")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+
+Compares the throughput (investigated positions per second) of BAM and CRAM
+input, per engine and number of decompression threads, on a synthetic data
+set:
+
+  $ python scripts/benchmark_cram.py --length 10000000 --reads 500000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from blc.blc import BamLorenzCoverage  # noqa: E402
+from blc.reference import ReferenceCache  # noqa: E402
+from benchmark import write_synthetic_bam  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BAM vs CRAM throughput of bam-lorenz-coverage')
+    parser.add_argument('--length', type=int, default=5000000, help='contig length')
+    parser.add_argument('--reads', type=int, default=250000, help='number of reads')
+    parser.add_argument('--read-length', type=int, default=100)
+    parser.add_argument('--decompression-threads', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        reference = os.path.join(tmp_dir, 'reference.fa')
+        bam_file = os.path.join(tmp_dir, 'reads.bam')
+        cram_file = os.path.join(tmp_dir, 'reads.cram')
+        write_synthetic_bam(bam_file, args.length, args.reads * args.read_length / args.length, args.read_length, unevenness=0,
+                            reference=reference, cram_file=cram_file)
+        reference_cache = ReferenceCache(os.path.join(tmp_dir, 'cache'))
+
+        print("format\tengine\tdecompression_threads\treference_cache\tseconds\tpositions_per_second")
+        for engine in BamLorenzCoverage.ENGINES:
+            for decompression_threads in args.decompression_threads:
+                for alignment_file, cache in [(bam_file, None), (cram_file, None), (cram_file, reference_cache)]:
+                    b = BamLorenzCoverage(engine, reference=reference, decompression_threads=decompression_threads, reference_cache=cache)
+
+                    start = time.perf_counter()
+                    idx_observed, n = b.bam_file_to_idx(alignment_file)
+                    seconds = time.perf_counter() - start
+
+                    print(f"{os.path.splitext(alignment_file)[1][1:]}\t{engine}\t{decompression_threads}\t{cache is not None}\t{seconds:.3f}\t{n / seconds:.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import os
+import io
+import gzip
+import tempfile
+from blc.bed import read_bed_regions, merge_intervals, write_bed_regions
+from utils import main
+
+
+TEST_DIR = "tests/blc/"
+
+BED = ("track name=targets\n"
+       "chr2\t10\t20\n"
+       "chr1\t50\t60\n"
+       "chr1\t0\t6\n"
+       "chr1\t3\t8\n"
+       "chrUn\t0\t100\n"
+       "chr1\t8\t12\n"
+       "chr2\t25\t99\n")
+
+
+class TestBed(unittest.TestCase):
+    def test_001_merge_intervals(self):
+        self.assertListEqual(merge_intervals([(50, 60), (0, 6), (3, 8), (8, 12), (20, 20)]), [(0, 12), (50, 60)])
+        self.assertListEqual(merge_intervals([]), [])
+
+    def test_002_read_bed_regions(self):
+        lengths = {'chr1': 100, 'chr2': 30}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            bed_file = os.path.join(tmp_dir, 'targets.bed')
+            with open(bed_file, 'w') as fh:
+                fh.write(BED)
+
+            bgzip_file = os.path.join(tmp_dir, 'targets.bed.gz')
+            with gzip.open(bgzip_file, 'wt') as fh:
+                fh.write(BED)
+
+            for filename in [bed_file, bgzip_file]:
+                spans = read_bed_regions(filename, lengths)
+
+                # header order, sorted, merged, clipped to the contig length, unknown contigs dropped
+                self.assertListEqual(list(spans.items()), [('chr1', [(0, 12), (50, 60)]), ('chr2', [(10, 20), (25, 30)])])
+
+    def test_003_test_blc_013(self):
+        self.assertEqual(read_bed_regions(TEST_DIR + "test_blc_013.bed", {'chr1': 14}), {'chr1': [(2, 14)]})
+
+    def test_004_write_bed_regions(self):
+        output = io.StringIO()
+        write_bed_regions({'chr1': [(0, 12), (50, 60)], 'chr2': [(10, 20)]}, output)
+
+        self.assertEqual(output.getvalue(), "chr1\t0\t12\nchr1\t50\t60\nchr2\t10\t20\n")
+
+
+if __name__ == '__main__':
+    main()
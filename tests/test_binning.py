@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import os
+import tempfile
+import numpy as np
+from collections import defaultdict
+from click.testing import CliRunner
+from blc.blc import BamLorenzCoverage
+from blc.binning import LogBinning
+from blc.cli import CLI
+from utils import main, sam_to_sorted_bam
+
+
+TEST_DIR = "tests/blc/"
+T_TEST_DIR = "tmp/" + TEST_DIR
+
+
+# Nosetests doesn't use main()
+if not os.path.exists(T_TEST_DIR):
+    os.makedirs(T_TEST_DIR)
+
+
+def bin_idx(binning, idx_observed):
+    binned = defaultdict(int)
+    depths = np.array(sorted(idx_observed), dtype=np.int64)
+    indices = binning.index(depths)
+    for depth, representative_depth in zip(depths.tolist(), binning.depths(int(indices.max()) + 1)[indices].tolist()):
+        binned[representative_depth] += idx_observed[depth]
+
+    return dict(binned)
+
+
+class TestLogBinning(unittest.TestCase):
+    def test_001_relative_error(self):
+        for exact_depth, relative_error in [(1000, 0.01), (10, 0.1), (0, 0.5)]:
+            binning = LogBinning(exact_depth, relative_error)
+
+            depths = np.arange(200000)
+            indices = binning.index(depths)
+            representative_depths = binning.depths(int(indices.max()) + 1)[indices]
+
+            np.testing.assert_array_equal(indices[:exact_depth + 1], depths[:exact_depth + 1])
+            self.assertTrue(np.all(np.diff(indices) >= 0))
+            self.assertTrue(np.all(np.abs(representative_depths - depths) <= relative_error * depths))
+            self.assertLessEqual(len(binning.depths(int(indices.max()) + 1)), binning.max_bins())
+
+    def test_002_bounded(self):
+        binning = LogBinning()
+
+        indices = binning.index(np.array([0, 1000, 1001, 2 ** 62]))
+        self.assertListEqual(indices[0:3].tolist(), [0, 1000, 1001])
+        self.assertLess(indices[3], binning.max_bins())
+        self.assertLess(binning.max_bins(), 3000)
+
+        # the bins only depend on the settings: dense arrays of bins of different workers add up
+        np.testing.assert_array_equal(LogBinning().depths(1500), binning.depths(1500))
+
+        with self.assertRaises(ValueError):
+            LogBinning(10, 1.0)
+
+    def test_003_roc_error_bound(self):
+        rng = np.random.default_rng(1)
+        b = BamLorenzCoverage()
+
+        for exact_depth, relative_error in [(100, 0.01), (100, 0.1), (0, 0.3)]:
+            binning = LogBinning(exact_depth, relative_error)
+
+            idx_observed = {int(depth): int(frequency) for depth, frequency in enumerate(np.bincount(rng.gamma(2.0, 500.0, 100000).astype(np.int64))) if frequency}
+            binned_idx_observed = bin_idx(binning, idx_observed)
+
+            self.assertLess(len(binned_idx_observed), len(idx_observed))
+            self.assertEqual(sum(binned_idx_observed.values()), sum(idx_observed.values()))
+            self.assertLessEqual(abs(b.estimate_lorenz_curves(binned_idx_observed)['roc'] - b.estimate_lorenz_curves(idx_observed)['roc']),
+                                 binning.roc_error_bound(binned_idx_observed))
+
+        self.assertEqual(LogBinning(1000, 0.01).roc_error_bound({0: 10, 5: 3, 1000: 1}), 0.0)
+
+    def test_004_engines(self):
+        # with exact depth 0 and relative error 0.5 depths 1 and 2 share a bin, represented by 1
+        test_id = 'blc_024'
+
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+        sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", input_file_bam)
+
+        for engine in BamLorenzCoverage.ENGINES:
+            for threads in [1, 2]:
+                b = BamLorenzCoverage(engine, threads, binning=LogBinning(0, 0.5))
+                b.SHARD_SIZE = 3
+
+                self.assertEqual(b.bam_file_to_idx(input_file_bam, 'chr1'), ({0: 12, 1: 8}, 20))
+                self.assertEqual(b.bam_file_to_region_idx(input_file_bam)['chr1'], ({0: 12, 1: 8}, 20))
+                self.assertEqual(b.settings()['binning'], [0, 0.5])
+
+    def test_005_cli(self):
+        input_file_bam = T_TEST_DIR + "test_blc_024.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_024.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            stats = os.path.join(output_dir, 'stats.txt')
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '-r', 'chr1', '-s', stats, '--exact-depth', '0', '--relative-error', '0.5', '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(stats, 'r') as fh:
+                lines = dict(line.split('\t') for line in fh.read().strip().split('\n'))
+
+            self.assertEqual(lines['total_sequenced_bases'], '8')
+            self.assertEqual(lines['ROC_Lorenz_curve'], '0.5')
+            self.assertEqual(float(lines['ROC_Lorenz_curve_error_bound']), 1.0)
+
+
+if __name__ == '__main__':
+    main()
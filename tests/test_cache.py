@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import os
+import time
+import tempfile
+from blc.blc import BamLorenzCoverage
+from blc.cache import HistogramCache
+from utils import main, sam_to_sorted_bam
+
+
+TEST_DIR = "tests/blc/"
+T_TEST_DIR = "tmp/" + TEST_DIR
+
+
+# Nosetests doesn't use main()
+if not os.path.exists(T_TEST_DIR):
+    os.makedirs(T_TEST_DIR)
+
+
+class TestHistogramCache(unittest.TestCase):
+    def test_001_put_get(self):
+        input_file_bam = T_TEST_DIR + "test_blc_011.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_011.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = HistogramCache(cache_dir)
+            key = cache.key(input_file_bam, None, None, {'engine': 'native'})
+
+            self.assertIsNone(cache.get(key))
+            cache.put(key, {0: 6, 1: 6, 2: 2}, 14)
+            self.assertEqual(cache.get(key), ({0: 6, 1: 6, 2: 2}, 14))
+
+    def test_002_key(self):
+        input_file_bam = T_TEST_DIR + "test_blc_013.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_013.sam", input_file_bam)
+
+        cache = HistogramCache(None)
+        key = cache.key(input_file_bam)
+
+        self.assertEqual(key, cache.key(input_file_bam))
+        self.assertNotEqual(key, cache.key(input_file_bam, 'chr1:2-14'))
+        self.assertNotEqual(key, cache.key(input_file_bam, None, TEST_DIR + "test_blc_013.bed"))
+        self.assertNotEqual(key, cache.key(input_file_bam, None, None, {'skip_zero_depth': True}))
+
+        # rewriting the alignment file invalidates the entry
+        time.sleep(0.01)
+        sam_to_sorted_bam(TEST_DIR + "test_blc_013.sam", input_file_bam)
+        self.assertNotEqual(key, cache.key(input_file_bam))
+
+    def test_003_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = HistogramCache(cache_dir)
+            for key in ['a', 'b', 'c']:
+                cache.put(key, {0: 1}, 1)
+                time.sleep(0.01)
+
+            cache.get('a')  # 'b' is now least recently used
+
+            cache.max_size = 2 * os.path.getsize(os.path.join(cache_dir, 'a.json'))
+            cache.evict()
+
+            self.assertIsNotNone(cache.get('a'))
+            self.assertIsNone(cache.get('b'))
+            self.assertIsNotNone(cache.get('c'))
+
+    def test_004_bam_file_to_idx_uses_cache(self):
+        input_file_bam = T_TEST_DIR + "test_blc_011.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_011.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for threads in [1, 2]:
+                b = BamLorenzCoverage('native', threads, cache=HistogramCache(cache_dir))
+                self.assertEqual(b.bam_file_to_idx(input_file_bam), ({0: 6, 1: 6, 2: 2}, 14))
+
+                # a second run must be served from the cache
+                b.cache.put(b.cache.key(input_file_bam, None, None, b.settings()), {0: 1}, 1)
+                self.assertEqual(b.bam_file_to_idx(input_file_bam), ({0: 1}, 1))
+                self.assertListEqual(list(b.bam_files_to_idx([input_file_bam])), [({0: 1}, 1)])
+
+                for filename in os.listdir(cache_dir):
+                    os.remove(os.path.join(cache_dir, filename))
+
+
+if __name__ == '__main__':
+    main()
@@ -11,8 +11,16 @@ import os
 import io
 import tempfile
 import re
+import numpy as np
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from multiprocessing import Process
+import pysam
 from blc.blc import BamLorenzCoverage
-from utils import main, sam_to_sorted_bam
+from blc.histogram import DepthHistogram
+from blc.reference import ReferenceCache
+from utils import main, sam_to_sorted_bam, sam_to_sorted_cram
 
 
 TEST_DIR = "tests/blc/"
@@ -24,6 +32,12 @@ if not os.path.exists(T_TEST_DIR):
     os.makedirs(T_TEST_DIR)
 
 
+def copy_file(source, destination):
+    # shutil.copyfile refuses to write to named pipes
+    with open(source, 'rb') as fh_in, open(destination, 'wb') as fh_out:
+        fh_out.write(fh_in.read())
+
+
 class TestIntronicBreakDetection(unittest.TestCase):
     def test_001_estimate_idx_from_bam(self):
         test_id = 'blc_001'
@@ -413,6 +427,469 @@ class TestIntronicBreakDetection(unittest.TestCase):
             if os.path.exists(temp_path):
                 os.unlink(temp_path)
 
+    def test_024_native_engine(self):
+        # chr2 only has a duplicate read and chr3 has no reads at all: both are skipped, like samtools depth -a does
+        # read_01 has a deletion, which is not counted as coverage
+
+        test_id = 'blc_024'
+
+        input_file_sam = TEST_DIR + "test_" + test_id + ".sam"
+        input_file_bed = TEST_DIR + "test_" + test_id + ".bed"
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+
+        sam_to_sorted_bam(input_file_sam, input_file_bam)
+
+        b = BamLorenzCoverage('native')
+
+        idx, n = b.bam_file_to_idx(input_file_bam)
+        self.assertDictEqual(idx, {0: 19, 1: 8, 2: 3})
+        self.assertEqual(n, 30)
+
+        # overlapping bed intervals count once
+        idx, n = b.bam_file_to_idx(input_file_bam, None, input_file_bed)
+        self.assertDictEqual(idx, {0: 6, 1: 4, 2: 1})
+        self.assertEqual(n, 11)
+
+        # explicitly requested regions are always reported
+        idx, n = b.bam_file_to_idx(input_file_bam, 'chr2:11-20')
+        self.assertDictEqual(idx, {0: 10})
+        self.assertEqual(n, 10)
+
+    def test_025_native_engine_equals_samtools_engine(self):
+        for test_id, region, bed in [('blc_001', None, None), ('blc_004', None, None), ('blc_005', None, None),
+                                     ('blc_006', None, None), ('blc_007', None, None), ('blc_011', None, None),
+                                     ('blc_012', 'chr1:2-14', None), ('blc_013', None, TEST_DIR + "test_blc_013.bed"),
+                                     ('blc_024', None, TEST_DIR + "test_blc_024.bed")]:
+            input_file_sam = TEST_DIR + "test_" + test_id + ".sam"
+            input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+
+            sam_to_sorted_bam(input_file_sam, input_file_bam)
+
+            native = BamLorenzCoverage('native')
+            native.WINDOW_SIZE = 7  # force reads to span multiple windows
+
+            self.assertEqual(native.bam_file_to_idx(input_file_bam, region, bed),
+                             BamLorenzCoverage('samtools').bam_file_to_idx(input_file_bam, region, bed))
+
+    def test_026_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            BamLorenzCoverage('bedtools')
+
+    def test_027_parallel_equals_serial(self):
+        test_id = 'blc_024'
+
+        input_file_sam = TEST_DIR + "test_" + test_id + ".sam"
+        input_file_bed = TEST_DIR + "test_" + test_id + ".bed"
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+
+        sam_to_sorted_bam(input_file_sam, input_file_bam)
+
+        for region, bed in [(None, None), ('chr1:3-17', None), ('chr2', None), (None, input_file_bed)]:
+            expected = BamLorenzCoverage().bam_file_to_idx(input_file_bam, region, bed)
+
+            for engine in BamLorenzCoverage.ENGINES:
+                b = BamLorenzCoverage(engine, threads=2)
+                b.SHARD_SIZE = 4  # force many shards per contig
+
+                self.assertEqual(b.bam_file_to_idx(input_file_bam, region, bed), expected)
+
+    def test_028_shards(self):
+        b = BamLorenzCoverage()
+        b.SHARD_SIZE = 10
+
+        shards = b._shards({'chr1': [(0, 3), (5, 9), (12, 30)], 'chr2': [(0, 4)]})
+
+        self.assertListEqual(shards, [('chr1', [(0, 3), (5, 9)]),
+                                      ('chr1', [(12, 22)]),
+                                      ('chr1', [(22, 30)]),
+                                      ('chr2', [(0, 4)])])
+
+        with self.assertRaises(ValueError):
+            BamLorenzCoverage(threads=0)
+
+    def test_029_parse_depth_stream(self):
+        stream = b"chr1\t1\t0\nchr1\t2\t12\nchr1\t3\t12\n\nchr_with_a_long_name\t4\t1234567\nchr1\t5\t3"
+
+        b = BamLorenzCoverage()
+        for buffer_size in [1, 3, 7, 256 * 1024]:
+            b.READ_BUFFER_SIZE = buffer_size  # small buffers force lines to be split over chunks
+
+            counts = b._depth_stream_to_counts(io.BytesIO(stream))
+            self.assertEqual(b._counts_to_idx(counts), ({0: 1, 3: 1, 12: 2, 1234567: 1}, 5))
+
+        with self.assertRaises(ValueError):
+            b._depth_stream_to_counts(io.BytesIO(b"chr1\t1\t1x\n"))
+
+    def test_030_skip_zero_depth(self):
+        test_id = 'blc_024'
+
+        input_file_sam = TEST_DIR + "test_" + test_id + ".sam"
+        input_file_bed = TEST_DIR + "test_" + test_id + ".bed"
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+
+        sam_to_sorted_bam(input_file_sam, input_file_bam)
+
+        for region, bed in [(None, None), ('chr1:3-17', None), ('chr2', None), (None, input_file_bed)]:
+            b = BamLorenzCoverage()
+            idx, n = b.bam_file_to_idx(input_file_bam, region, bed)
+
+            for threads in [1, 2]:
+                sparse = BamLorenzCoverage('samtools', threads, skip_zero_depth=True)
+                sparse_idx, sparse_n = sparse.bam_file_to_idx(input_file_bam, region, bed)
+
+                self.assertEqual((sparse_idx, sparse_n), (idx, n))
+                self.assertEqual(sparse.estimate_cumulative_coverage_curves(sparse_idx), b.estimate_cumulative_coverage_curves(idx))
+
+                if region != 'chr2':  # no coverage at all, so there is no lorenz curve
+                    self.assertEqual(sparse.estimate_lorenz_curves(sparse_idx), b.estimate_lorenz_curves(idx))
+
+    def test_031_bam_files_to_idx(self):
+        input_files_bam = []
+        for test_id in ['blc_007', 'blc_011', 'blc_024']:
+            input_files_bam.append(T_TEST_DIR + "test_" + test_id + ".bam")
+            sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", input_files_bam[-1])
+
+        expected = [BamLorenzCoverage().bam_file_to_idx(input_file_bam) for input_file_bam in input_files_bam]
+
+        for threads in [1, 2]:
+            b = BamLorenzCoverage('native', threads)
+            self.assertListEqual(list(b.bam_files_to_idx(input_files_bam)), expected)
+
+    def test_032_shards_sum_up(self):
+        test_id = 'blc_024'
+
+        input_file_sam = TEST_DIR + "test_" + test_id + ".sam"
+        input_file_bed = TEST_DIR + "test_" + test_id + ".bed"
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+
+        sam_to_sorted_bam(input_file_sam, input_file_bam)
+
+        for region, bed in [(None, None), ('chr1:3-17', None), (None, input_file_bed)]:
+            expected = BamLorenzCoverage().bam_file_to_idx(input_file_bam, region, bed)
+
+            for engine in BamLorenzCoverage.ENGINES:
+                for threads in [1, 2]:
+                    idx_observed = {}
+                    n = 0
+                    for index in range(1, 5):
+                        shard_idx_observed, shard_n = BamLorenzCoverage(engine, threads, shard=(index, 4)).bam_file_to_idx(input_file_bam, region, bed)
+                        for depth, frequency in shard_idx_observed.items():
+                            idx_observed[depth] = idx_observed.get(depth, 0) + frequency
+                        n += shard_n
+
+                    self.assertEqual((idx_observed, n), expected)
+
+    def test_033_shard_spans(self):
+        spans = {'chr1': [(0, 10)], 'chr2': [(0, 3), (5, 8)]}
+
+        self.assertEqual(BamLorenzCoverage._shard_spans(spans, 1, 2), {'chr1': [(0, 8)]})
+        self.assertEqual(BamLorenzCoverage._shard_spans(spans, 2, 2), {'chr1': [(8, 10)], 'chr2': [(0, 3), (5, 8)]})
+        self.assertEqual(BamLorenzCoverage._shard_spans(spans, 1, 1), spans)
+
+        with self.assertRaises(ValueError):
+            BamLorenzCoverage(shard=(3, 2))
+
+    def test_034_fetch_windows(self):
+        b = BamLorenzCoverage()
+        b.WINDOW_SIZE = 100
+        b.FETCH_GAP = 10
+
+        # nearby spans share a window, distant spans and long spans do not
+        self.assertListEqual(list(b._fetch_windows([(0, 10), (15, 20), (50, 60), (65, 230)])),
+                             [(0, 20, [(0, 10), (15, 20)]),
+                              (50, 60, [(50, 60)]),
+                              (65, 165, [(65, 165)]),
+                              (165, 230, [(165, 230)])])
+
+    def test_035_approximate(self):
+        test_id = 'blc_024'
+
+        input_file_sam = TEST_DIR + "test_" + test_id + ".sam"
+        input_file_bed = TEST_DIR + "test_" + test_id + ".bed"
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+
+        sam_to_sorted_bam(input_file_sam, input_file_bam)
+
+        for engine in BamLorenzCoverage.ENGINES:
+            b = BamLorenzCoverage(engine)
+            b.SAMPLE_WINDOW_SIZE = 3
+
+            # sampling all windows is exact
+            for region, bed in [(None, None), ('chr1:3-17', None), (None, input_file_bed)]:
+                for stratified in [False, True]:
+                    idx_observed, n, report = b.approximate_bam_file_to_idx(input_file_bam, region, bed, 1.0, stratified)
+                    self.assertEqual((idx_observed, n), BamLorenzCoverage().bam_file_to_idx(input_file_bam, region, bed))
+                    self.assertEqual(report['sampled_fraction'], 1.0)
+                    self.assertEqual(report['sampled_windows'], report['windows'])
+
+            # a sample is scaled up to all investigated positions and is reproducible with the same seed
+            idx_observed, n, report = b.approximate_bam_file_to_idx(input_file_bam, rate=0.5, seed=1)
+            self.assertEqual(n, 30)
+            self.assertEqual(sum(idx_observed.values()), 30)
+            self.assertEqual(report['windows'], 11)
+            self.assertEqual(report['sampled_windows'], 6)
+            self.assertLessEqual(report['roc_ci'][0], report['roc_ci'][1])
+            self.assertEqual(b.approximate_bam_file_to_idx(input_file_bam, rate=0.5, seed=1), (idx_observed, n, report))
+
+    def test_036_stream(self):
+        test_id = 'blc_024'
+
+        input_file_sam = TEST_DIR + "test_" + test_id + ".sam"
+        input_file_bed = TEST_DIR + "test_" + test_id + ".bed"
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+
+        sam_to_sorted_bam(input_file_sam, input_file_bam)
+
+        b = BamLorenzCoverage()
+        b.WINDOW_SIZE = 3
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fifo = os.path.join(tmp_dir, 'alignments.fifo')
+            os.mkfifo(fifo)
+            self.assertTrue(b.is_stream(fifo))
+            self.assertTrue(b.is_stream('-'))
+            self.assertFalse(b.is_stream(input_file_bam))
+
+            for input_file in [input_file_bam, input_file_sam]:
+                for region, bed in [(None, None), ('chr1:3-17', None), ('chr2:11-20', None), (None, input_file_bed)]:
+                    writer = Process(target=copy_file, args=(input_file, fifo))
+                    writer.start()
+                    idx = b.bam_file_to_idx(fifo, region, bed)
+                    writer.join()
+
+                    self.assertEqual(idx, BamLorenzCoverage().bam_file_to_idx(input_file_bam, region, bed))
+
+        # stretches without reads are not materialised
+        counts, carry, block_starts, block_ends = b._stream_flush([(0, 10), (20, 10 ** 12)], 0, 10 ** 12, 0, [], [])
+        self.assertListEqual(counts.tolist(), [10 ** 12 - 10])
+
+    def test_037_cram(self):
+        test_id = 'blc_024'
+
+        input_file_sam = TEST_DIR + "test_" + test_id + ".sam"
+        input_file_bed = TEST_DIR + "test_" + test_id + ".bed"
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+        input_file_cram = T_TEST_DIR + "test_" + test_id + ".cram"
+        reference = T_TEST_DIR + "test_" + test_id + ".fa"
+
+        shutil.copyfile(TEST_DIR + "test_" + test_id + ".fa", reference)
+        sam_to_sorted_bam(input_file_sam, input_file_bam)
+        sam_to_sorted_cram(input_file_sam, input_file_cram, reference)
+
+        for region, bed in [(None, None), ('chr1:3-17', None), (None, input_file_bed)]:
+            expected = BamLorenzCoverage().bam_file_to_idx(input_file_bam, region, bed)
+
+            for engine in BamLorenzCoverage.ENGINES:
+                for threads in [1, 2]:
+                    self.assertEqual(BamLorenzCoverage(engine, threads, reference=reference, decompression_threads=2).bam_file_to_idx(input_file_cram, region, bed), expected)
+
+        # decoding from the reference cache, without the FASTA file
+        with tempfile.TemporaryDirectory() as cache_dir, mock.patch.dict(os.environ):
+            for engine in BamLorenzCoverage.ENGINES:
+                b = BamLorenzCoverage(engine, reference=reference, reference_cache=ReferenceCache(cache_dir))
+                self.assertIsNone(b._reference_filename(input_file_cram))
+
+                os.rename(reference, reference + '.moved')
+                try:
+                    self.assertEqual(b.bam_file_to_idx(input_file_cram), BamLorenzCoverage().bam_file_to_idx(input_file_bam))
+                finally:
+                    os.rename(reference + '.moved', reference)
+
+            # the environment of htslib is only changed while a file is decoded
+            self.assertNotIn(os.path.join(cache_dir, 'ref'), os.environ.get('REF_PATH', ''))
+
+        # the cache is only populated for CRAM files, other files get the FASTA file
+        with tempfile.TemporaryDirectory() as cache_dir:
+            b = BamLorenzCoverage(reference=reference, reference_cache=ReferenceCache(cache_dir))
+            self.assertEqual(b.bam_file_to_idx(input_file_bam), BamLorenzCoverage().bam_file_to_idx(input_file_bam))
+            self.assertEqual(b._reference_filename(input_file_bam), reference)
+            self.assertFalse(os.path.exists(os.path.join(cache_dir, 'ref')))
+
+            # a CRAM file without M5 tags is decoded from the FASTA file
+            input_file_cram_no_m5 = T_TEST_DIR + "test_" + test_id + ".no_m5.cram"
+            header_no_m5 = os.path.join(cache_dir, 'header.sam')
+            shutil.copyfile(input_file_cram, input_file_cram_no_m5)
+            with open(header_no_m5, 'w') as fh:
+                fh.write(''.join(line for line in pysam.view('-H', input_file_cram).splitlines(True) if not line.startswith('@SQ')))
+                fh.write(''.join(f"@SQ\tSN:{contig}\tLN:{length}\n" for contig, length in zip(pysam.AlignmentFile(input_file_bam).references, pysam.AlignmentFile(input_file_bam).lengths)))
+            pysam.samtools.reheader('-i', header_no_m5, input_file_cram_no_m5)
+            pysam.index(input_file_cram_no_m5)
+
+            self.assertEqual(b._reference_filename(input_file_cram_no_m5), reference)
+            self.assertEqual(b.bam_file_to_idx(input_file_cram_no_m5), BamLorenzCoverage().bam_file_to_idx(input_file_bam))
+
+    def test_038_read_filters(self):
+        test_id = 'blc_024'
+
+        input_file_sam = TEST_DIR + "test_" + test_id + ".sam"
+        input_file_bed = TEST_DIR + "test_" + test_id + ".bed"
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+
+        sam_to_sorted_bam(input_file_sam, input_file_bam)
+
+        for filters, expected in [({'min_mapq': 1}, ({0: 12, 1: 5, 2: 3}, 20)),
+                                  ({'exclude_flags': 0}, ({0: 44, 1: 13, 2: 3}, 60)),
+                                  ({'min_baseq': 34}, ({0: 22, 1: 7, 2: 1}, 30)),
+                                  ({'exclude_flags': 0, 'include_flags': 0x400}, ({0: 25, 1: 5}, 30))]:
+            for engine in BamLorenzCoverage.ENGINES:
+                for threads in [1, 2]:
+                    for skip_zero_depth in [False, True]:
+                        b = BamLorenzCoverage(engine, threads, skip_zero_depth, **filters)
+                        self.assertEqual(b.bam_file_to_idx(input_file_bam), expected)
+
+                        # filters apply to regions and BED regions as well
+                        for region, bed in [('chr1:3-17', None), ('chr2:1-10', None), (None, input_file_bed)]:
+                            self.assertEqual(b.bam_file_to_idx(input_file_bam, region, bed), BamLorenzCoverage(**filters).bam_file_to_idx(input_file_bam, region, bed))
+
+            self.assertEqual(BamLorenzCoverage('native', **filters).approximate_bam_file_to_idx(input_file_bam, rate=1.0)[0:2], expected)
+
+    def test_039_curves_from_arrays(self):
+        b = BamLorenzCoverage()
+
+        # a dense array of frequencies (indexed by depth) gives the same curves as a dict
+        idx_observed = {0: 9, 1: 2, 2: 4, 3: 1}
+        counts = np.array([9, 2, 4, 1])
+        self.assertEqual(b.estimate_lorenz_curves(counts), b.estimate_lorenz_curves(idx_observed))
+        self.assertEqual(b.estimate_cumulative_coverage_curves(counts), b.estimate_cumulative_coverage_curves(idx_observed))
+
+        # beyond int64, the ROC is still computed exactly
+        lorenz_curves = b.estimate_lorenz_curves({1: 10 ** 10, 10 ** 6: 10 ** 10})
+        self.assertEqual(lorenz_curves['roc'], 1.0 * (10 ** 26 + 3 * 10 ** 20) / (2 * (10 ** 16 + 10 ** 10) * 2 * 10 ** 10))
+        self.assertEqual(lorenz_curves['total_sequenced_bases'], 10 ** 16 + 10 ** 10)
+        self.assertEqual(lorenz_curves['total_covered_positions_of_genome'], 2 * 10 ** 10)
+
+        # rounding is identical to python its round(), also for values halfway between two decimals
+        self.assertListEqual(b._round(np.array([0.00015, 0.12345, 1 / 3.0]), 4).tolist(), [round(0.00015, 4), round(0.12345, 4), round(1 / 3.0, 4)])
+
+    def test_040_reduce_curve(self):
+        b = BamLorenzCoverage()
+
+        idx_observed = {depth: 1 + depth % 7 for depth in range(1000)}
+        lorenz_curves = b.estimate_lorenz_curves(idx_observed)
+
+        xs, ys = b.reduce_curve(lorenz_curves['fraction_reads'], lorenz_curves['fraction_genome'], 50)
+        self.assertEqual(len(xs), 50)
+        self.assertEqual((xs[0], ys[0]), (0.0, 0.0))
+        self.assertEqual((xs[-1], ys[-1]), (1.0, 1.0))
+
+        # only exact points of the curve, in order
+        points = list(zip(lorenz_curves['fraction_reads'], lorenz_curves['fraction_genome']))
+        self.assertListEqual(sorted(points.index(point) for point in zip(xs, ys)), [points.index(point) for point in zip(xs, ys)])
+
+        # short curves are not changed
+        self.assertEqual(b.reduce_curve([0, 1, 2], [3, 4, 5], 50), ([0, 1, 2], [3, 4, 5]))
+        self.assertEqual(b.reduce_curve([0, 1, 2], [3, 4, 5]), ([0, 1, 2], [3, 4, 5]))
+
+        output = io.StringIO()
+        b.export_lorenz_curves(lorenz_curves, output, 20)
+        self.assertEqual(len(output.getvalue().strip().split("\n")), 1 + 20)
+
+    def test_041_concurrent_plots(self):
+        b = BamLorenzCoverage()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with ThreadPoolExecutor(8) as pool:
+                futures = []
+                for i in range(1, 17):
+                    lorenz_curves = b.estimate_lorenz_curves({0: i, 1: 4, 2: 1})
+                    futures.append(pool.submit(b.export_lorenz_plot, lorenz_curves, os.path.join(tmp_dir, f'{i}.lorenz.svg')))
+                    futures.append(pool.submit(b.export_cumulative_coverage_plot, b.estimate_cumulative_coverage_curves({0: i, 1: 4, 2: 1}), os.path.join(tmp_dir, f'{i}.coverage.svg')))
+                for future in futures:
+                    future.result()
+
+            # every figure only contains its own curve
+            for i in range(1, 17):
+                with open(os.path.join(tmp_dir, f'{i}.lorenz.svg'), 'r') as fh:
+                    content = fh.read()
+                roc = b.estimate_lorenz_curves({0: i, 1: 4, 2: 1})['roc']
+                self.assertEqual(re.findall(r'ROC=[0-9.]+', content), [f'ROC={roc:.3f}'])
+                self.assertEqual(content.count('<!-- Fraction covered genome -->'), 1)
+
+                with open(os.path.join(tmp_dir, f'{i}.coverage.svg'), 'r') as fh:
+                    self.assertEqual(fh.read().count('<!-- Minimum coverage depth -->'), 1)
+
+    def test_042_per_region(self):
+        # geneA has overlapping intervals, which count once, and overlaps geneB; geneC only has a
+        # duplicate read and geneE is not on any contig of the alignment file
+        test_id = 'blc_024'
+
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+        sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", input_file_bam)
+
+        for threads in [1, 2]:
+            b = BamLorenzCoverage('samtools', threads)
+            b.SHARD_SIZE = 3
+
+            regions = b.bam_file_to_region_idx(input_file_bam, TEST_DIR + "test_blc_025.bed")
+            self.assertListEqual(list(regions.keys()), ['geneA', 'geneB', 'geneC', 'geneD'])
+            self.assertEqual(regions['geneA'], ({0: 3, 1: 4, 2: 1}, 8))
+            self.assertEqual(regions['geneB'], ({0: 1, 1: 3, 2: 3}, 7))
+            self.assertEqual(regions['geneC'], ({0: 4}, 4))
+            self.assertEqual(regions['geneD'], ({0: 7, 1: 3}, 10))
+
+            # per contig, all contigs are reported: also the ones without (filter passing) reads
+            regions = b.bam_file_to_region_idx(input_file_bam)
+            self.assertDictEqual(regions, {'chr1': ({0: 12, 1: 5, 2: 3}, 20), 'chr2': ({0: 30}, 30), 'chr3': ({0: 10}, 10), 'chr4': ({0: 7, 1: 3}, 10)})
+            for contig in ['chr1', 'chr4']:
+                self.assertEqual(regions[contig], b.bam_file_to_idx(input_file_bam, contig))
+
+    def test_043_window_rocs(self):
+        # chr2 only has a duplicate read and chr3 has no reads: their windows have no ROC
+        test_id = 'blc_024'
+
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+        sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", input_file_bam)
+
+        for threads in [1, 2]:
+            b = BamLorenzCoverage('samtools', threads)
+            b.SHARD_SIZE = 3
+
+            rocs = list(b.bam_file_to_window_rocs(input_file_bam, 10))
+            self.assertListEqual([roc[0:3] for roc in rocs], [('chr1', 0, 10), ('chr1', 10, 20), ('chr4', 0, 10)])
+            for contig, start, end, roc in rocs:
+                idx_observed, n = b.bam_file_to_idx(input_file_bam, f"{contig}:{start + 1}-{end}")
+                self.assertAlmostEqual(roc, b.estimate_lorenz_curves(idx_observed)['roc'])
+
+            # windows stay on the grid of the contig, only the positions within the region count
+            rocs = list(b.bam_file_to_window_rocs(input_file_bam, 10, 'chr1:6-20'))
+            self.assertListEqual([roc[0:3] for roc in rocs], [('chr1', 0, 10), ('chr1', 10, 20)])
+            self.assertAlmostEqual(rocs[0][3], b.estimate_lorenz_curves(b.bam_file_to_idx(input_file_bam, 'chr1:6-10')[0])['roc'])
+
+        with self.assertRaises(ValueError):
+            list(BamLorenzCoverage().bam_file_to_window_rocs('-', 10))
+
+    def test_044_library_histograms(self):
+        test_id = 'blc_024'
+
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+        sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", input_file_bam)
+
+        b = BamLorenzCoverage()
+        with pysam.AlignmentFile(input_file_bam) as alignment_file:
+            for region in [None, 'chr1', 'chr2:1-10']:
+                histogram = b.alignment_file_to_histogram(alignment_file, region)
+                idx_observed, n = b.bam_file_to_idx(input_file_bam, region)
+
+                self.assertIsInstance(histogram, DepthHistogram)
+                self.assertEqual(histogram, idx_observed)
+                self.assertEqual(histogram.total, n)
+
+            histogram = b.alignment_file_to_histogram(alignment_file, bed_regions=TEST_DIR + "test_" + test_id + ".bed")
+            self.assertEqual(histogram, b.bam_file_to_idx(input_file_bam, bed_regions=TEST_DIR + "test_" + test_id + ".bed")[0])
+            self.assertFalse(alignment_file.closed)
+
+        # the estimators and exporters take the histogram as is
+        histogram = b.depth_to_histogram(np.array([0, 0, 1, 2, 2, 2, 3, 2, 1, 0, 0, 0, 0, 0, 0, 0], dtype=np.uint32))
+        self.assertEqual(histogram, {0: 9, 1: 2, 2: 4, 3: 1})
+
+        lorenz_curves = b.estimate_lorenz_curves(histogram)
+        self.assertDictEqual(lorenz_curves, b.estimate_lorenz_curves(histogram.to_dict()))
+        self.assertDictEqual(b.estimate_cumulative_coverage_curves(histogram), b.estimate_cumulative_coverage_curves(histogram.to_dict()))
+
+        output_stream = io.StringIO()
+        b.export_lorenz_curves(lorenz_curves, output_stream)
+        self.assertEqual(output_stream.getvalue().split('\n')[-2], "1.0\t1.0")
+
 
 if __name__ == '__main__':
     main()
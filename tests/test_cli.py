@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import os
+import tempfile
+from multiprocessing import Process
+from click.testing import CliRunner
+from blc.cli import CLI
+from blc.histogram import load_histogram
+from utils import main, sam_to_sorted_bam
+
+
+TEST_DIR = "tests/blc/"
+T_TEST_DIR = "tmp/" + TEST_DIR
+
+
+# Nosetests doesn't use main()
+if not os.path.exists(T_TEST_DIR):
+    os.makedirs(T_TEST_DIR)
+
+
+def copy_file(source, destination):
+    # shutil.copyfile refuses to write to named pipes
+    with open(source, 'rb') as fh_in, open(destination, 'wb') as fh_out:
+        fh_out.write(fh_in.read())
+
+
+class TestCLI(unittest.TestCase):
+    def test_001_stats(self):
+        input_file_bam = T_TEST_DIR + "test_blc_011.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_011.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            stats = os.path.join(output_dir, 'stats.txt')
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '-s', stats, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(stats, 'r') as fh:
+                self.assertEqual(fh.read(), "total_investigated_genomic_positions\t14\n"
+                                            "ROC_Lorenz_curve\t0.425\n"
+                                            "total_sequenced_bases\t10\n"
+                                            "total_covered_positions_of_genome\t8\n")
+
+    def test_002_batch(self):
+        for test_id in ['blc_007', 'blc_011']:
+            sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", T_TEST_DIR + "test_" + test_id + ".bam")
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            sample_sheet = os.path.join(output_dir, 'samples.tsv')
+            with open(sample_sheet, 'w') as fh:
+                fh.write("# sample\talignment file\n")
+                fh.write("sample_b\t" + T_TEST_DIR + "test_blc_011.bam\n")
+
+            result = CliRunner().invoke(CLI, [T_TEST_DIR + "test_blc_007.bam", '-S', sample_sheet, '-o', output_dir, '-t', '2', '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(os.path.join(output_dir, 'stats.tsv'), 'r') as fh:
+                lines = fh.read().strip().split('\n')
+
+            self.assertEqual(lines[0], "sample\tROC_Lorenz_curve\ttotal_sequenced_bases\ttotal_covered_positions_of_genome\ttotal_investigated_genomic_positions")
+            self.assertEqual(lines[1].split('\t')[0], "test_blc_007")
+            self.assertEqual(lines[2], "sample_b\t0.425\t10\t8\t14")
+
+            for sample in ['test_blc_007', 'sample_b']:
+                for suffix in ['.lorenz.tsv', '.coverage.tsv', '.lorenz.svg', '.coverage.svg', '.stats.txt', '.histogram.npz']:
+                    self.assertTrue(os.path.exists(os.path.join(output_dir, sample + suffix)))
+
+    def test_003_batch_requires_output_dir(self):
+        input_file_bam = T_TEST_DIR + "test_blc_011.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_011.sam", input_file_bam)
+
+        result = CliRunner().invoke(CLI, [input_file_bam, input_file_bam, '--no-cache'])
+        self.assertNotEqual(result.exit_code, 0)
+
+    def test_004_approximate(self):
+        input_file_bam = T_TEST_DIR + "test_blc_011.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_011.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            stats = os.path.join(output_dir, 'stats.txt')
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '-s', stats, '--approximate', '1', '--sampling', 'stratified', '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(stats, 'r') as fh:
+                lines = fh.read().strip().split('\n')
+
+            self.assertListEqual(lines[0:4], ["total_investigated_genomic_positions\t14",
+                                              "ROC_Lorenz_curve\t0.425",
+                                              "total_sequenced_bases\t10",
+                                              "total_covered_positions_of_genome\t8"])
+            self.assertEqual(lines[4], "approximate_sampled_fraction\t1.0")
+            self.assertTrue(lines[5].startswith("ROC_Lorenz_curve_CI95_low\t"))
+            self.assertTrue(lines[6].startswith("ROC_Lorenz_curve_CI95_high\t"))
+
+    def test_005_batch_stream(self):
+        for test_id in ['blc_007', 'blc_011']:
+            sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", T_TEST_DIR + "test_" + test_id + ".bam")
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            # a named pipe that is not the first input is only opened once, when it is scanned
+            fifo = os.path.join(output_dir, 'test_blc_011.fifo')
+            os.mkfifo(fifo)
+            writer = Process(target=copy_file, args=(T_TEST_DIR + "test_blc_011.bam", fifo))
+            writer.start()
+
+            result = CliRunner().invoke(CLI, [T_TEST_DIR + "test_blc_007.bam", fifo, '-o', output_dir, '--no-cache'])
+            writer.join()
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(os.path.join(output_dir, 'stats.tsv'), 'r') as fh:
+                lines = fh.read().strip().split('\n')
+
+            self.assertEqual(lines[2], "test_blc_011\t0.425\t10\t8\t14")
+            self.assertTrue(os.path.exists(os.path.join(output_dir, 'test_blc_011.histogram.npz')))
+
+    def test_006_read_filters(self):
+        input_file_bam = T_TEST_DIR + "test_blc_024.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_024.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            stats = os.path.join(output_dir, 'stats.txt')
+
+            for args, total in [([], 30), (['-Q', '1'], 20), (['--exclude-flags', '0'], 60), (['--exclude-flags', 'UNMAP', '--exclude-duplicates'], 30)]:
+                result = CliRunner().invoke(CLI, [input_file_bam, '-s', stats, '--no-cache'] + args)
+                self.assertEqual(result.exit_code, 0, result.output)
+
+                with open(stats, 'r') as fh:
+                    self.assertEqual(fh.readline(), "total_investigated_genomic_positions\t" + str(total) + "\n")
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '--exclude-flags', 'UNMAP,UNKNOWN', '--no-cache'])
+            self.assertNotEqual(result.exit_code, 0)
+
+    def test_007_per_region(self):
+        input_file_bam = T_TEST_DIR + "test_blc_024.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_024.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            region_stats = os.path.join(output_dir, 'regions.tsv')
+            region_curves = os.path.join(output_dir, 'curves')
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '--per-region', TEST_DIR + "test_blc_025.bed", '--region-stats', region_stats, '--region-curves', region_curves, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(region_stats, 'r') as fh:
+                lines = fh.read().strip().split('\n')
+
+            self.assertEqual(lines[0], "region\tROC_Lorenz_curve\ttotal_sequenced_bases\ttotal_covered_positions_of_genome\ttotal_investigated_genomic_positions")
+            self.assertListEqual([line.split('\t')[0] for line in lines[1:]], ['geneA', 'geneB', 'geneC', 'geneD'])
+            self.assertListEqual(lines[1].split('\t')[2:], ['6', '5', '8'])
+            self.assertEqual(lines[3], "geneC\tNA\t0\t0\t4")
+
+            for name in ['geneA', 'geneB', 'geneD']:
+                for suffix in ['.lorenz.tsv', '.coverage.tsv']:
+                    self.assertTrue(os.path.exists(os.path.join(region_curves, name + suffix)))
+            self.assertFalse(os.path.exists(os.path.join(region_curves, 'geneC.lorenz.tsv')))
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '--per-contig', '--region-stats', region_stats, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(region_stats, 'r') as fh:
+                self.assertListEqual([line.split('\t')[0] for line in fh.read().strip().split('\n')[1:]], ['chr1', 'chr2', 'chr3', 'chr4'])
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '--per-contig', '--region-stats', region_stats, '-s', os.path.join(output_dir, 'stats.txt'), '--no-cache'])
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn("-s", result.output)
+
+            # depth histograms and coverage files have no per position depth to split by region
+            histogram = os.path.join(output_dir, 'test_blc_024.histogram.npz')
+            result = CliRunner().invoke(CLI, [input_file_bam, '-H', histogram, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            for input_file, option in [(histogram, ['--per-region', TEST_DIR + "test_blc_025.bed"]), (TEST_DIR + "test_blc_026.bedgraph", ['--per-contig'])]:
+                result = CliRunner().invoke(CLI, [input_file] + option + ['--region-stats', region_stats, '--no-cache'])
+                self.assertEqual(result.exit_code, 2, result.output)
+                self.assertIn(f"Option '{option[0]}' requires an alignment file", result.output)
+
+    def test_008_roc_track(self):
+        input_file_bam = T_TEST_DIR + "test_blc_024.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_024.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            roc_track = os.path.join(output_dir, 'roc.bedGraph')
+            stats = os.path.join(output_dir, 'stats.txt')
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '--roc-track', roc_track, '--track-window-size', '10', '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(roc_track, 'r') as fh:
+                lines = fh.read().strip().split('\n')
+
+            self.assertTrue(lines[0].startswith('track type=bedGraph'))
+            self.assertListEqual([line.split('\t')[0:3] for line in lines[1:]], [['chr1', '0', '10'], ['chr1', '10', '20'], ['chr4', '0', '10']])
+            self.assertEqual(lines[2], "chr1\t10\t20\t0.5")
+
+            # in combination with the regular outputs
+            result = CliRunner().invoke(CLI, [input_file_bam, '--roc-track', roc_track, '-s', stats, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertTrue(os.path.exists(stats))
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '--roc-track', roc_track, '--approximate', '0.5', '--no-cache'])
+            self.assertEqual(result.exit_code, 2, result.output)
+            self.assertIn("Option '--roc-track' can not be combined with: --approximate.", result.output)
+
+            histogram = os.path.join(output_dir, 'test_blc_024.histogram.npz')
+            result = CliRunner().invoke(CLI, [input_file_bam, '-H', histogram, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            for input_file in [histogram, TEST_DIR + "test_blc_026.bedgraph"]:
+                result = CliRunner().invoke(CLI, [input_file, '--roc-track', roc_track, '--no-cache'])
+                self.assertEqual(result.exit_code, 2, result.output)
+                self.assertIn("Option '--roc-track' requires an alignment file", result.output)
+
+    def test_009_reexport_histogram(self):
+        input_file_bam = T_TEST_DIR + "test_blc_011.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_011.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            histogram = os.path.join(output_dir, 'test_blc_011.histogram.npz')
+            reexported = os.path.join(output_dir, 'reexported.histogram.npz')
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '-H', histogram, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            result = CliRunner().invoke(CLI, [histogram, '-H', reexported, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            self.assertEqual(load_histogram(reexported), load_histogram(histogram))
+            self.assertEqual(load_histogram(reexported)[2]['source'], os.path.abspath(input_file_bam))
+
+    def test_010_unsorted_stream(self):
+        with open(TEST_DIR + "test_blc_011.sam", 'r') as fh:
+            lines = fh.read().strip().split('\n')
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            # read_02 before read_01
+            unsorted_sam = os.path.join(output_dir, 'unsorted.sam')
+            with open(unsorted_sam, 'w') as fh:
+                fh.write('\n'.join(lines[0:3] + [lines[4], lines[3]]) + '\n')
+
+            fifo = os.path.join(output_dir, 'unsorted.fifo')
+            os.mkfifo(fifo)
+            writer = Process(target=copy_file, args=(unsorted_sam, fifo))
+            writer.start()
+
+            result = CliRunner().invoke(CLI, [fifo, '-s', os.path.join(output_dir, 'stats.txt'), '--no-cache'])
+            writer.join()
+            self.assertEqual(result.exit_code, 2, result.output)
+            self.assertIn("Alignment stream is not coordinate sorted: chr1:4 occurs after chr1:7", result.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import os
+import gzip
+import tempfile
+import pysam
+from click.testing import CliRunner
+from blc.blc import BamLorenzCoverage
+from blc.cli import CLI
+from blc.coverage import read_runs, is_coverage_file
+from blc import coverage
+from utils import main, sam_to_sorted_bam
+
+
+TEST_DIR = "tests/blc/"
+T_TEST_DIR = "tmp/" + TEST_DIR
+
+
+# Nosetests doesn't use main()
+if not os.path.exists(T_TEST_DIR):
+    os.makedirs(T_TEST_DIR)
+
+
+class TestCoverage(unittest.TestCase):
+    def test_001_read_runs(self):
+        # test_blc_026.bedgraph is the coverage of test_blc_024.sam, with uncovered runs (bedtools genomecov -bga)
+        runs = list(read_runs(TEST_DIR + "test_blc_026.bedgraph"))
+
+        self.assertListEqual([contig for contig, starts, ends, depths in runs], ['chr1', 'chr2', 'chr3', 'chr4'])
+        self.assertListEqual(runs[0][1].tolist(), [0, 3, 5, 6, 8, 10, 11])
+        self.assertListEqual(runs[0][2].tolist(), [3, 5, 6, 8, 10, 11, 20])
+        self.assertListEqual(runs[0][3].tolist(), [0, 1, 2, 1, 2, 1, 0])
+
+        # lines split over chunks
+        runs = list(coverage._read_bedgraph_runs(TEST_DIR + "test_blc_026.bedgraph", buffer_size=8))
+        self.assertEqual(sum(len(starts) for contig, starts, ends, depths in runs), 12)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'sample.bedgraph')
+            with open(filename, 'w') as fh:
+                fh.write("# comment\r\nchr1\t0\t5\t2.4\textra\r\n\r\nchr1\t5\t7\t0.6\r\nchr10\t0\t1\t3")
+
+            runs = list(read_runs(filename))
+            self.assertListEqual([(contig, starts.tolist(), ends.tolist(), depths.tolist()) for contig, starts, ends, depths in runs],
+                                 [('chr1', [0, 5], [5, 7], [2, 1]), ('chr10', [0], [1], [3])])
+
+            with open(filename, 'w') as fh:
+                fh.write("chr1 0 5 2\n")
+            with self.assertRaises(ValueError):
+                list(read_runs(filename))
+
+        self.assertTrue(is_coverage_file('sample.per-base.bed.gz'))
+        self.assertTrue(is_coverage_file('sample.bw'))
+        self.assertFalse(is_coverage_file('sample.bam'))
+
+    def test_002_run_length_file_to_idx(self):
+        test_id = 'blc_024'
+
+        input_file_bam = T_TEST_DIR + "test_" + test_id + ".bam"
+        sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", input_file_bam)
+
+        b = BamLorenzCoverage()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # mosdepth writes bgzip, other tools gzip
+            bgzip_file = os.path.join(tmp_dir, 'sample.per-base.bed.gz')
+            pysam.tabix_compress(TEST_DIR + "test_blc_026.bedgraph", bgzip_file)
+            gzip_file = os.path.join(tmp_dir, 'sample.bedgraph.gz')
+            with open(TEST_DIR + "test_blc_026.bedgraph", 'rb') as fh_in, gzip.open(gzip_file, 'wb') as fh_out:
+                fh_out.write(fh_in.read())
+
+            for coverage_file in [TEST_DIR + "test_blc_026.bedgraph", bgzip_file, gzip_file]:
+                # all positions in the file count, also of contigs without reads
+                self.assertEqual(b.run_length_file_to_idx(coverage_file), ({0: 59, 1: 8, 2: 3}, 70))
+
+                for region in ['chr1', 'chr1:5-9', 'chr2', 'chr4:2-100']:
+                    self.assertEqual(b.run_length_file_to_idx(coverage_file, region), b.bam_file_to_idx(input_file_bam, region))
+
+                # unlike samtools depth -b, the BED regions of chr2 (without reads) count
+                self.assertEqual(b.run_length_file_to_idx(coverage_file, bed_regions=TEST_DIR + "test_blc_024.bed"), ({0: 10, 1: 4, 2: 1}, 15))
+                self.assertEqual(b.bam_file_to_idx(input_file_bam, bed_regions=TEST_DIR + "test_blc_024.bed"), ({0: 6, 1: 4, 2: 1}, 11))
+
+    def test_003_cli(self):
+        input_file_bam = T_TEST_DIR + "test_blc_024.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_024.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            stats = os.path.join(output_dir, 'stats.txt')
+            stats_bam = os.path.join(output_dir, 'stats_bam.txt')
+
+            result = CliRunner().invoke(CLI, [TEST_DIR + "test_blc_026.bedgraph", '-r', 'chr1', '-s', stats, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            result = CliRunner().invoke(CLI, [input_file_bam, '-r', 'chr1', '-s', stats_bam, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(stats, 'r') as fh, open(stats_bam, 'r') as fh_bam:
+                self.assertEqual(fh.read(), fh_bam.read())
+
+            result = CliRunner().invoke(CLI, [TEST_DIR + "test_blc_026.bedgraph", '--approximate', '0.5', '-s', stats, '--no-cache'])
+            self.assertNotEqual(result.exit_code, 0)
+            self.assertIn("--approximate", result.output)
+
+            # a partial histogram of a coverage file would be merged as if it were the whole file
+            result = CliRunner().invoke(CLI, [TEST_DIR + "test_blc_026.bedgraph", '--shard', '1/2', '-H', os.path.join(output_dir, 'shard_1.histogram.npz'), '--no-cache'])
+            self.assertEqual(result.exit_code, 2, result.output)
+            self.assertIn("Option '--shard' can not be applied to coverage files.", result.output)
+            self.assertFalse(os.path.exists(os.path.join(output_dir, 'shard_1.histogram.npz')))
+
+            with self.assertRaises(ValueError):
+                BamLorenzCoverage(shard=(1, 2)).run_length_file_to_idx(TEST_DIR + "test_blc_026.bedgraph")
+
+
+if __name__ == '__main__':
+    main()
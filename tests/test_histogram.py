@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import os
+import tempfile
+import numpy as np
+from click.testing import CliRunner
+from blc.cli import CLI, MERGE
+from blc.histogram import DepthHistogram, save_histogram, load_histogram, merge_histograms, is_histogram_file
+from utils import main, sam_to_sorted_bam
+
+
+TEST_DIR = "tests/blc/"
+T_TEST_DIR = "tmp/" + TEST_DIR
+
+
+# Nosetests doesn't use main()
+if not os.path.exists(T_TEST_DIR):
+    os.makedirs(T_TEST_DIR)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_001_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'sample.histogram')
+
+            save_histogram(filename, {0: 6, 2: 2, 1: 6}, 14, {'region': 'chr1'})
+
+            self.assertTrue(os.path.exists(filename))  # no .npz suffix appended
+            self.assertTrue(is_histogram_file(filename))
+            self.assertEqual(load_histogram(filename), ({0: 6, 1: 6, 2: 2}, 14, {'region': 'chr1'}))
+
+    def test_002_not_a_histogram(self):
+        input_file_bam = T_TEST_DIR + "test_blc_011.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_011.sam", input_file_bam)
+
+        self.assertFalse(is_histogram_file(input_file_bam))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'other.npz')
+            np.savez(filename, depth=np.arange(3))
+
+            self.assertFalse(is_histogram_file(filename))
+            with self.assertRaises(ValueError):
+                load_histogram(filename)
+
+    def test_003_cli_from_histogram(self):
+        input_file_bam = T_TEST_DIR + "test_blc_011.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_011.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            histogram = os.path.join(tmp_dir, 'test_blc_011.histogram.npz')
+            stats_bam = os.path.join(tmp_dir, 'stats_bam.txt')
+            stats_histogram = os.path.join(tmp_dir, 'stats_histogram.txt')
+
+            result = CliRunner().invoke(CLI, [input_file_bam, '-H', histogram, '-s', stats_bam, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            idx_observed, n, metadata = load_histogram(histogram)
+            self.assertEqual((idx_observed, n), ({0: 6, 1: 6, 2: 2}, 14))
+            self.assertEqual(metadata['settings']['engine'], 'samtools')
+
+            result = CliRunner().invoke(CLI, [histogram, '-s', stats_histogram, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+
+            with open(stats_bam, 'r') as fh_bam, open(stats_histogram, 'r') as fh_histogram:
+                self.assertEqual(fh_bam.read(), fh_histogram.read())
+
+            result = CliRunner().invoke(CLI, [histogram, '-r', 'chr1:1-5', '-s', stats_histogram, '--no-cache'])
+            self.assertNotEqual(result.exit_code, 0)
+
+    def test_004_merge(self):
+        input_file_bam = T_TEST_DIR + "test_blc_024.bam"
+        sam_to_sorted_bam(TEST_DIR + "test_blc_024.sam", input_file_bam)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            partials = []
+            for index in range(1, 4):
+                partials.append(os.path.join(tmp_dir, f'shard_{index}.npz'))
+                result = CliRunner().invoke(CLI, [input_file_bam, '--shard', f'{index}/3', '-H', partials[-1], '--no-cache'])
+                self.assertEqual(result.exit_code, 0, result.output)
+
+            idx_observed, n, metadata = merge_histograms(partials)
+            self.assertEqual((idx_observed, n), ({0: 19, 1: 8, 2: 3}, 30))
+            self.assertEqual(metadata['merged_shards'], 3)
+
+            with self.assertRaisesRegex(ValueError, 'missing shard'):
+                merge_histograms(partials[0:2])
+
+            with self.assertRaisesRegex(ValueError, 'more than once'):
+                merge_histograms(partials + partials[0:1])
+
+            # a shard of another run (different region)
+            other = os.path.join(tmp_dir, 'other.npz')
+            result = CliRunner().invoke(CLI, [input_file_bam, '-r', 'chr1', '--shard', '3/3', '-H', other, '--no-cache'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            with self.assertRaisesRegex(ValueError, 'same run'):
+                merge_histograms(partials[0:2] + [other])
+
+            stats = os.path.join(tmp_dir, 'stats.txt')
+            result = CliRunner().invoke(MERGE, partials + ['-s', stats])
+            self.assertEqual(result.exit_code, 0, result.output)
+            with open(stats, 'r') as fh:
+                self.assertIn("total_investigated_genomic_positions\t30\n", fh.read())
+
+    def test_005_depth_histogram(self):
+        histogram = DepthHistogram.from_depth(np.array([0, 3, 1, 0, 3, 3], dtype=np.uint8))
+
+        self.assertEqual(histogram, {0: 2, 1: 1, 3: 3})
+        self.assertListEqual(histogram.depths.tolist(), [0, 1, 3])
+        self.assertEqual(histogram.total, 6)
+        self.assertEqual(histogram[3], 3)
+        with self.assertRaises(KeyError):
+            histogram[2]
+
+        self.assertEqual(histogram + {2: 1, 3: 1}, {0: 2, 1: 1, 2: 1, 3: 4})
+        self.assertEqual(DepthHistogram.from_counts(np.array([2, 1, 0, 3])), histogram)
+        self.assertEqual(DepthHistogram.from_dict({3: 3, 0: 2, 1: 1, 7: 0}), histogram)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'sample.histogram')
+            save_histogram(filename, histogram, histogram.total)
+            self.assertEqual(load_histogram(filename)[0:2], ({0: 2, 1: 1, 3: 3}, 6))
+
+        for depth in [np.array([1.0, 2.0]), np.array([1, -1])]:
+            with self.assertRaises(ValueError):
+                DepthHistogram.from_depth(depth)
+
+        with self.assertRaises(ValueError):
+            DepthHistogram([3, 1], [1, 1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import io
+import numpy as np
+from blc.lines import read_line_chunks, parse_integers
+from utils import main
+
+
+class TestLines(unittest.TestCase):
+    def test_001_read_line_chunks(self):
+        text = b"a\t1\nbb\t22\n\nlong line\t333\nlast\t4"
+
+        # small buffers force lines to be split over chunks and the buffer to grow
+        for buffer_size in [1, 3, 7, 1024]:
+            record = {}
+            lines = []
+            for chunk, newlines in read_line_chunks(io.BytesIO(text), buffer_size, record):
+                line_starts = np.concatenate(([0], newlines[:-1] + 1))
+                lines += [bytes(chunk[start:end]) for start, end in zip(line_starts, newlines)]
+
+            self.assertListEqual(lines, [b"a\t1", b"bb\t22", b"", b"long line\t333", b"last\t4"])
+            self.assertEqual(record, {'bytes_read': len(text), 'lines_parsed': 5})
+
+    def test_002_parse_integers(self):
+        chunk = np.frombuffer(b"0\t12\t345\tx1\t", dtype=np.uint8)
+
+        self.assertListEqual(parse_integers(chunk, np.array([0, 2, 5]), np.array([1, 4, 8])).tolist(), [0, 12, 345])
+        self.assertIsNone(parse_integers(chunk, np.array([0, 9]), np.array([1, 11])))
+        self.assertIsNone(parse_integers(chunk, np.array([0, 1]), np.array([1, 1])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import os
+import json
+import pickle
+import tempfile
+from click.testing import CliRunner
+from blc.blc import BamLorenzCoverage
+from blc.cli import CLI
+from blc.metrics import Metrics
+from utils import main, sam_to_sorted_bam
+
+
+TEST_DIR = "tests/blc/"
+T_TEST_DIR = "tmp/" + TEST_DIR
+
+
+# Nosetests doesn't use main()
+if not os.path.exists(T_TEST_DIR):
+    os.makedirs(T_TEST_DIR)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_001_stage(self):
+        finished = []
+        metrics = Metrics([finished.append])
+
+        with metrics.stage('count', positions=10) as record:
+            record['lines_parsed'] = 3
+
+        self.assertEqual(len(finished), 1)
+        self.assertIs(finished[0], metrics.stages[0])
+        self.assertEqual(finished[0]['stage'], 'count')
+        self.assertEqual(finished[0]['lines_parsed'], 3)
+        for key in ['wall_seconds', 'cpu_seconds', 'children_cpu_seconds', 'positions_per_second', 'peak_rss_bytes']:
+            self.assertIn(key, finished[0])
+
+        # failed stages are recorded as well
+        with self.assertRaises(ValueError):
+            with metrics.stage('fail'):
+                raise ValueError()
+        self.assertEqual(metrics.stages[-1]['stage'], 'fail')
+
+        # copies for worker processes have neither callbacks nor earlier stages
+        remote = pickle.loads(pickle.dumps(metrics))
+        self.assertTrue(remote.remote)
+        self.assertEqual(remote.callbacks, [])
+        self.assertEqual(remote.stages, [])
+
+    def test_002_stages(self):
+        test_id = 'blc_007'
+        sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", T_TEST_DIR + "test_" + test_id + ".bam")
+
+        for engine in BamLorenzCoverage.ENGINES:
+            metrics = Metrics()
+            b = BamLorenzCoverage(engine, metrics=metrics)
+
+            idx_observed, n = b.bam_file_to_idx(T_TEST_DIR + "test_" + test_id + ".bam")
+            b.estimate_lorenz_curves(idx_observed)
+
+            stages = {record['stage']: record for record in metrics.stages}
+            self.assertEqual(stages['bam_file_to_idx']['positions'], n)
+            self.assertFalse(stages['bam_file_to_idx']['cached'])
+            self.assertIn('estimate_lorenz_curves', stages)
+
+            if engine == 'samtools':
+                self.assertIn('samtools_spawn', stages)
+                self.assertEqual(stages['samtools_depth_read']['lines_parsed'], n)
+                self.assertGreater(stages['samtools_depth_read']['bytes_read'], 0)
+
+    def test_003_cli(self):
+        test_id = 'blc_007'
+        sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", T_TEST_DIR + "test_" + test_id + ".bam")
+
+        for threads in ['1', '2']:
+            with tempfile.TemporaryDirectory() as output_dir:
+                metrics_file = os.path.join(output_dir, 'metrics.json')
+
+                result = CliRunner().invoke(CLI, [T_TEST_DIR + "test_" + test_id + ".bam", '-L', os.path.join(output_dir, 'lorenz.svg'),
+                                                  '-s', os.path.join(output_dir, 'stats.txt'), '-t', threads, '--no-cache', '--metrics', metrics_file])
+                self.assertEqual(result.exit_code, 0, result.output)
+
+                with open(metrics_file, 'r') as fh:
+                    metrics = json.load(fh)
+
+                self.assertIn('peak_rss_bytes', metrics)
+                # figures rendered in worker processes are included
+                self.assertListEqual(sorted(record['stage'] for record in metrics['stages'] if record['stage'] != 'samtools_spawn' and record['stage'] != 'samtools_depth_read'),
+                                     ['bam_file_to_idx', 'estimate_lorenz_curves', 'export_lorenz_plot'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import os
+import io
+from unittest import mock
+from blc.blc import BamLorenzCoverage
+from blc.progress import Progress
+from utils import main, sam_to_sorted_bam
+
+
+TEST_DIR = "tests/blc/"
+T_TEST_DIR = "tmp/" + TEST_DIR
+
+
+# Nosetests doesn't use main()
+if not os.path.exists(T_TEST_DIR):
+    os.makedirs(T_TEST_DIR)
+
+
+class TestProgress(unittest.TestCase):
+    def test_001_progress(self):
+        stream = io.StringIO()
+        progress = Progress('sample.bam', 200, stream, interval=0.0)
+
+        progress.update(50)
+        progress.update(50)
+        self.assertEqual(len(stream.getvalue().strip().split("\n")), 2)
+        self.assertTrue(stream.getvalue().startswith("sample.bam:  25.0% of 200 positions, "))
+        self.assertIn("ETA 0:00:00", stream.getvalue())
+
+        # reaching the total is left to finish()
+        progress.update(100)
+        self.assertEqual(len(stream.getvalue().strip().split("\n")), 2)
+
+        progress.finish()
+        last = stream.getvalue().strip().split("\n")[-1]
+        self.assertTrue(last.startswith("sample.bam: 100.0% of 200 positions, "))
+        self.assertIn("done in 0:00:00", last)
+
+        # sampled: nothing is written within the interval
+        stream = io.StringIO()
+        progress = Progress('sample.bam', 200, stream, interval=3600.0)
+        for i in range(100):
+            progress.update(1)
+        self.assertEqual(stream.getvalue(), '')
+
+        self.assertEqual(Progress._duration(3725.4), '1:02:05')
+
+    def test_002_engines(self):
+        test_id = 'blc_007'
+        sam_to_sorted_bam(TEST_DIR + "test_" + test_id + ".sam", T_TEST_DIR + "test_" + test_id + ".bam")
+
+        for engine in BamLorenzCoverage.ENGINES:
+            for threads in [1, 2]:
+                b = BamLorenzCoverage(engine, threads, progress=True)
+
+                with mock.patch('sys.stderr', new=io.StringIO()) as stderr:
+                    idx_observed, n = b.bam_file_to_idx(T_TEST_DIR + "test_" + test_id + ".bam")
+
+                self.assertTrue(stderr.getvalue().strip().split("\n")[-1].startswith(f"test_{test_id}.bam: 100.0% of {n} positions, "))
+
+        # without progress nothing is written
+        with mock.patch('sys.stderr', new=io.StringIO()) as stderr:
+            BamLorenzCoverage().bam_file_to_idx(T_TEST_DIR + "test_" + test_id + ".bam")
+        self.assertEqual(stderr.getvalue(), '')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from blc.cache import HistogramCache
+from blc.reference import ReferenceCache
+from utils import main
+
+
+TEST_DIR = "tests/blc/"
+T_TEST_DIR = "tmp/" + TEST_DIR
+
+
+# Nosetests doesn't use main()
+if not os.path.exists(T_TEST_DIR):
+    os.makedirs(T_TEST_DIR)
+
+
+class TestReferenceCache(unittest.TestCase):
+    def test_001_populate(self):
+        reference = T_TEST_DIR + "test_blc_024.fa"
+        shutil.copyfile(TEST_DIR + "test_blc_024.fa", reference)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ReferenceCache(cache_dir)
+            cache.BLOCK_SIZE = 7  # sequences are written block by block
+            md5s = cache.populate(reference)
+
+            # md5 of the chr1 sequence, as in the M5 tag of a CRAM header
+            self.assertIn('33aa2fe7de229862f335130115e56fb7', md5s)
+            with open(os.path.join(cache_dir, 'ref', '33', 'aa', '2fe7de229862f335130115e56fb7'), 'rb') as fh:
+                self.assertEqual(fh.read(), b'TCCCCCACGATTAACTTGTA')
+
+            # a FASTA file is only read once
+            with mock.patch('pysam.FastaFile') as fasta_file:
+                self.assertEqual(cache.populate(reference), md5s)
+                fasta_file.assert_not_called()
+
+            # ... unless one of its sequences was evicted
+            os.remove(os.path.join(cache_dir, 'ref', '33', 'aa', '2fe7de229862f335130115e56fb7'))
+            self.assertEqual(cache.populate(reference), md5s)
+            self.assertTrue(os.path.exists(os.path.join(cache_dir, 'ref', '33', 'aa', '2fe7de229862f335130115e56fb7')))
+
+    def test_002_environment(self):
+        with mock.patch.dict(os.environ, {'REF_PATH': 'http://www.ebi.ac.uk/ena/cram/md5/%s'}):
+            os.environ.pop('REF_CACHE', None)
+
+            cache = ReferenceCache('/cache')
+            with cache.environment():
+                with cache.environment():
+                    self.assertEqual(os.environ['REF_PATH'], '/cache/ref/%2s/%2s/%s:http://www.ebi.ac.uk/ena/cram/md5/%s')
+                    self.assertEqual(os.environ['REF_CACHE'], '/cache/ref/%2s/%2s/%s')
+
+            # only within the context
+            self.assertEqual(os.environ['REF_PATH'], 'http://www.ebi.ac.uk/ena/cram/md5/%s')
+            self.assertNotIn('REF_CACHE', os.environ)
+
+    def test_003_max_size(self):
+        reference = T_TEST_DIR + "test_blc_024.fa"
+        shutil.copyfile(TEST_DIR + "test_blc_024.fa", reference)
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            # a reference larger than the cache is not cached
+            self.assertIsNone(ReferenceCache(cache_dir, 10).populate(reference))
+            self.assertFalse(os.path.exists(os.path.join(cache_dir, 'ref')))
+
+            # the sequences count against the size of the histogram cache, and are evicted with it
+            self.assertIsNotNone(ReferenceCache(cache_dir, 1000).populate(reference))
+            HistogramCache(cache_dir, 100).put('key', {0: 10, 1: 4}, 14)
+
+            files = [os.path.join(directory, filename) for directory, subdirectories, filenames in os.walk(cache_dir) for filename in filenames]
+            self.assertLessEqual(sum(os.path.getsize(filename) for filename in files), 100)
+            self.assertListEqual([os.path.basename(filename) for filename in files], ['key.json'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# *- coding: utf-8 -*-
+# vim: set expandtab tabstop=4 shiftwidth=4 softtabstop=4 textwidth=79:
+
+"""[License: GNU General Public License v3 (GPLv3)]
+"""
+
+
+import unittest
+import subprocess
+import sys
+import time
+from utils import main
+
+
+def startup_time(code, repeats=3):
+    """
+    fastest of a few runs of a fresh interpreter, in seconds
+    """
+    timings = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+class TestStartup(unittest.TestCase):
+    def test_001_lazy_imports(self):
+        output = subprocess.run([sys.executable, '-c', "import sys, blc.cli; print(' '.join(sorted(m for m in ('matplotlib', 'pysam') if m in sys.modules)))"],
+                                check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+        self.assertEqual(output.strip(), '')
+
+    def test_002_startup_time(self):
+        # the CLI may only take a fraction of a second on top of its unavoidable dependencies
+        baseline = startup_time("import click, numpy")
+        cli = startup_time("import sys; sys.argv = ['bam-lorenz-coverage', '--version']; from blc.cli import main\ntry:\n    main()\nexcept SystemExit:\n    pass")
+
+        self.assertLess(cli - baseline, 0.25, f"startup took {cli:.3f}s, of which {baseline:.3f}s for click and numpy")
+
+
+if __name__ == '__main__':
+    main()
@@ -31,5 +31,18 @@ def sam_to_sorted_bam(sam_file, fixed_bam, tmp_dir='/tmp'):
     return bam_file
 
 
+def sam_to_sorted_cram(sam_file, fixed_cram, reference, tmp_dir='/tmp'):
+    basename, ext = os.path.splitext(os.path.basename(sam_file))
+    bam_file = os.path.join(tmp_dir, basename + '.sorted.bam')
+
+    sam_to_sorted_bam(sam_file, bam_file, tmp_dir)
+    pysam.view('-C', '-T', reference, '-o', fixed_cram, bam_file, catch_stdout=False)
+    pysam.index(fixed_cram)
+    os.remove(bam_file)
+    os.remove(bam_file + '.bai')
+
+    return fixed_cram
+
+
 def main():
     unittest.main()